@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Offline capture benchmark for the YouTube Live Frame Capture Telegram Bot
+
+Runs a local HLS test stream (ffmpeg testsrc), replaces yt-dlp resolution
+with the local playlist URL and points the bot at a fake Telegram Bot API
+server, then drives TelegramBotHandler with bursts of trigger messages.
+Everything runs on 127.0.0.1, no network access is needed.
+
+Usage:
+    python benchmark.py --bursts 5 --burst-size 20 --interval 3
+    python benchmark.py --profiles thumb,full,chart   # compare capture profiles
+    python benchmark.py --backends ffmpeg,pyav        # compare capture backends
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+BENCH_TOKEN = '123456:BENCHMARK'
+BENCH_WEBHOOK_SECRET = 'benchmark-secret'
+
+class LocalHlsStream:
+    """ffmpeg testsrc encoded to a live HLS playlist served over local HTTP"""
+    
+    def __init__(self, segment_type: str = 'mpegts', resolution: str = '1280x720'):
+        self.segment_type = segment_type
+        self.resolution = resolution
+        self.directory = tempfile.mkdtemp(prefix='bench_hls_')
+        self.process: Optional[subprocess.Popen] = None
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.lock = threading.Lock()
+        self.bytes_served = 0
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/live.m3u8"
+    
+    def start(self, timeout: float = 30):
+        cmd = [
+            'ffmpeg', '-loglevel', 'error', '-re',
+            '-f', 'lavfi', '-i', f'testsrc=size={self.resolution}:rate=25',
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency', '-g', '50',
+            '-f', 'hls', '-hls_time', '2', '-hls_list_size', '6',
+            '-hls_segment_type', self.segment_type, '-hls_flags', 'delete_segments',
+            os.path.join(self.directory, 'live.m3u8')
+        ]
+        self.process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
+        
+        handler = partial(QuietFileHandler, directory=self.directory, stream=self)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        
+        # Wait until the playlist lists a few segments
+        playlist = os.path.join(self.directory, 'live.m3u8')
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if os.path.exists(playlist):
+                with open(playlist) as f:
+                    if f.read().count('#EXTINF') >= 2:
+                        return
+            time.sleep(0.2)
+        raise RuntimeError("Local HLS stream did not start")
+    
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+        if self.server:
+            self.server.shutdown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class QuietFileHandler(SimpleHTTPRequestHandler):
+    """Serves the playlist and segments, counting bytes sent to the capture clients"""
+    
+    def __init__(self, *args, stream: LocalHlsStream, **kwargs):
+        self.stream = stream
+        super().__init__(*args, **kwargs)
+    
+    def copyfile(self, source, outputfile):
+        start = source.tell()
+        try:
+            super().copyfile(source, outputfile)
+        finally:
+            with self.stream.lock:
+                self.stream.bytes_served += source.tell() - start
+    
+    def log_message(self, format, *args):
+        pass
+
+class FakeTelegramApi:
+    """Minimal Bot API stand-in that answers instantly and records replies per chat"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.replies: Dict[int, float] = {}  # chat_id -> time of the final reply
+        self.outcomes: Dict[int, str] = {}
+        self.uploads = 0
+        self.upload_bytes = 0
+        self.message_id = 0
+        self.server: Optional[ThreadingHTTPServer] = None
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+    
+    def start(self):
+        api = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                method = self.path.rsplit('/', 1)[-1]
+                result = api.handle(method, body)
+                payload = json.dumps({'ok': True, 'result': result}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+    
+    def handle(self, method: str, body: bytes):
+        now = time.time()
+        match = re.search(rb'name="chat_id"\r\n\r\n(-?\d+)', body) or re.search(rb'chat_id=(-?\d+)', body)
+        chat_id = int(match.group(1)) if match else 0
+        
+        with self.lock:
+            self.message_id += 1
+            message = {
+                'message_id': self.message_id,
+                'date': int(now),
+                'chat': {'id': chat_id, 'type': 'private'},
+            }
+            
+            if method == 'getMe':
+                return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+            if method == 'sendPhoto':
+                if b'filename=' in body:
+                    self.uploads += 1
+                    self.upload_bytes += len(body)
+                self.replies[chat_id] = now
+                self.outcomes[chat_id] = 'photo'
+                message['photo'] = [{
+                    'file_id': f'bench-file-{self.uploads}',
+                    'file_unique_id': f'bench-unique-{self.uploads}',
+                    'width': 1280, 'height': 720
+                }]
+                return message
+            if method == 'editMessageText':
+                self.replies[chat_id] = now
+                self.outcomes[chat_id] = 'error'
+                message['text'] = 'error'
+                return message
+            if method == 'sendMessage':
+                # Busy, quota and error replies, or the status message a photo follows
+                self.replies[chat_id] = now
+                self.outcomes[chat_id] = 'message'
+                message['text'] = 'message'
+                return message
+            if method in ('deleteMessage', 'setWebhook', 'deleteWebhook'):
+                return True
+            message['text'] = 'ok'
+            return message
+
+class ProcessSampler:
+    """Samples the peak number of child processes (Linux /proc only)"""
+    
+    def __init__(self, exclude_pids=(), interval: float = 0.05):
+        self.exclude_pids = {str(pid) for pid in exclude_pids}
+        self.interval = interval
+        self.peak = 0
+        self.available = os.path.isdir('/proc')
+    
+    def count_children(self) -> int:
+        pid = str(os.getpid())
+        count = 0
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit() or entry in self.exclude_pids:
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                if fields[1] == pid:
+                    count += 1
+            except (OSError, IndexError):
+                continue
+        return count
+    
+    async def run(self):
+        while self.available:
+            self.peak = max(self.peak, self.count_children())
+            await asyncio.sleep(self.interval)
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def find_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def post_update(session, url: str, data: dict) -> int:
+    """Deliver an update the way Telegram does in webhook mode"""
+    headers = {'X-Telegram-Bot-Api-Secret-Token': BENCH_WEBHOOK_SECRET}
+    async with session.post(url, json=data, headers=headers) as response:
+        return response.status
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text,
+        }
+    }
+
+async def run_benchmark(args) -> dict:
+    os.environ['METRICS_PORT'] = '0'
+    from config import Config
+    from bot_handler import TelegramBotHandler
+    from metrics import REGISTRY
+    from stream_resolver import StreamVariant
+    from telegram import Update
+    
+    stream = LocalHlsStream(segment_type=args.segment_type)
+    api = FakeTelegramApi()
+    stream.start()
+    api.start()
+    
+    config = Config()
+    config.TELEGRAM_BOT_TOKEN = BENCH_TOKEN
+    config.TELEGRAM_API_BASE_URL = api.base_url
+    config.FRAME_FRESHNESS_WINDOW = args.freshness
+    config.WARM_READER_ENABLED = args.warm_reader
+    config.CAPTURE_BACKEND = args.backend
+    # Keep the synthetic frames out of the real look-back history and replica state
+    config.FRAME_HISTORY_ENABLED = False
+    config.SHARED_BACKEND = ''
+    # The trigger selects a stream of its own, resolved to the local playlist below
+    config.STREAMS = {args.trigger: 'https://www.youtube.com/watch?v=benchmark'}
+    
+    if args.mode == 'webhook':
+        config.UPDATE_MODE = 'webhook'
+        config.WEBHOOK_URL = ''
+        config.WEBHOOK_SECRET_TOKEN = BENCH_WEBHOOK_SECRET
+        config.WEBHOOK_LISTEN = '127.0.0.1'
+        config.WEBHOOK_PORT = find_free_port()
+    
+    bot = TelegramBotHandler(config)
+    # Stand-in for yt-dlp: every stream resolves to the local playlist
+    bot.frame_engine.get_live_stream_variants = lambda youtube_url: [StreamVariant(url=stream.url)]
+    
+    # The local stream's own ffmpeg is not counted
+    sampler = ProcessSampler(exclude_pids=[stream.process.pid])
+    sampler_task = asyncio.create_task(sampler.run())
+    sent: Dict[int, float] = {}
+    tasks = []
+    server = None
+    session = None
+    
+    try:
+        async with bot.application:
+            if args.mode == 'webhook':
+                import aiohttp
+                from webhook_server import WebhookServer
+                
+                server = WebhookServer(config, bot.application)
+                await server.start()
+                session = aiohttp.ClientSession()
+                webhook_url = f"http://127.0.0.1:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}"
+            
+            trigger = f"{args.trigger} {args.profile}" if args.profile else args.trigger
+            started = time.time()
+            update_id = 0
+            for burst in range(args.bursts):
+                for _ in range(args.burst_size):
+                    update_id += 1
+                    chat_id = 100000 + update_id
+                    data = make_update(update_id, chat_id, trigger)
+                    sent[chat_id] = time.time()
+                    if server:
+                        tasks.append(asyncio.create_task(post_update(session, webhook_url, data)))
+                    else:
+                        update = Update.de_json(data, bot.application.bot)
+                        tasks.append(asyncio.create_task(bot.application.process_update(update)))
+                if burst < args.bursts - 1:
+                    await asyncio.sleep(args.interval)
+            
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            if server:
+                # Wait for the workers to drain everything that was accepted
+                await server.queue.join()
+            finished = time.time()
+            await bot.frame_engine.close()
+    finally:
+        sampler_task.cancel()
+        if session:
+            await session.close()
+        if server:
+            await server.stop()
+        api.stop()
+        stream.stop()
+    
+    rejected = sum(1 for result in results if result == 429)
+    
+    latencies = [api.replies[chat_id] - t for chat_id, t in sent.items() if chat_id in api.replies]
+    photos = sum(1 for outcome in api.outcomes.values() if outcome == 'photo')
+    metrics_text = REGISTRY.render()
+    
+    def metric_total(name: str) -> float:
+        return sum(float(line.rsplit(' ', 1)[1]) for line in metrics_text.splitlines()
+                   if line.startswith(name) and not line.startswith('#'))
+    
+    captures = metric_total('frame_bot_stage_seconds_count{stage="capture"}')
+    return {
+        'profile': args.profile or config.DEFAULT_CAPTURE_PROFILE,
+        'backend': args.backend,
+        'requests': len(sent),
+        'photos': photos,
+        'errors': len(sent) - photos - rejected,
+        'rejected': rejected,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'throughput': photos / max(finished - started, 1e-9),
+        'uploads': api.uploads,
+        'upload_bytes': api.upload_bytes,
+        'capture_mean': metric_total('frame_bot_stage_seconds_sum{stage="capture"}') / max(captures, 1),
+        'spawn_mean': metric_total('frame_bot_stage_seconds_sum{stage="ffmpeg_spawn"}') / max(
+            metric_total('frame_bot_stage_seconds_count{stage="ffmpeg_spawn"}'), 1
+        ),
+        'captures': captures,
+        'stream_kb_per_capture': stream.bytes_served / 1024 / max(captures, 1),
+        'coalesced': metric_total('frame_bot_coalesced_requests_total'),
+        'cache_hits': metric_total('frame_bot_cache_hits_total{cache="frame"}'),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'peak_child_rss_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        'peak_processes': sampler.peak if sampler.available else None,
+    }
+
+def print_report(result: dict):
+    print("=" * 50)
+    print(f"Requests:          {result['requests']} ({result['photos']} photos, {result['errors']} errors, "
+          f"{result['rejected']} rejected with 429)")
+    print(f"Latency p50:       {result['p50']:.3f}s")
+    print(f"Latency p95:       {result['p95']:.3f}s")
+    print(f"Latency p99:       {result['p99']:.3f}s")
+    print(f"Throughput:        {result['throughput']:.2f} frames/s")
+    print(f"Captures:          {result['captures']:.0f} ({result['backend']} backend, "
+          f"{result['stream_kb_per_capture']:.0f} KB of stream per capture)")
+    print(f"Coalesced:         {result['coalesced']:.0f}, frame cache hits: {result['cache_hits']:.0f}")
+    print(f"Profile:           {result['profile']} (mean capture {result['capture_mean']:.3f}s, "
+          f"ffmpeg spawn {result['spawn_mean']:.3f}s)")
+    print(f"Photo uploads:     {result['uploads']} ({result['upload_bytes'] / 1024:.0f} KB)")
+    print(f"Peak RSS:          {result['peak_rss_mb']:.1f} MB (largest child {result['peak_child_rss_mb']:.1f} MB)")
+    peak = result['peak_processes']
+    print(f"Peak child procs:  {peak if peak is not None else 'n/a'}")
+    print("=" * 50)
+
+def compare_runs(option: str, values: List[str]):
+    """Benchmark each value of an option in a fresh process and print one row per value"""
+    base_args = []
+    argv = iter(sys.argv[1:])
+    for arg in argv:
+        if arg in ('--profiles', '--backends'):
+            next(argv, None)
+        elif not arg.startswith(('--profiles=', '--backends=')):
+            base_args.append(arg)
+    print(f"{option:<10} {'p50':>8} {'p95':>8} {'capture':>8} {'spawn':>8} {'KB/capture':>11} "
+          f"{'uploads':>8} {'KB/upload':>10}")
+    for value in values:
+        output = subprocess.run(
+            [sys.executable, __file__, *base_args, f'--{option}', value, '--json'],
+            capture_output=True, text=True
+        ).stdout
+        try:
+            result = json.loads(output[output.index('{'):])
+        except ValueError:
+            print(f"{value:<10} failed")
+            continue
+        per_upload = result['upload_bytes'] / 1024 / max(result['uploads'], 1)
+        print(f"{value:<10} {result['p50']:>7.3f}s {result['p95']:>7.3f}s {result['capture_mean']:>7.3f}s "
+              f"{result['spawn_mean']:>7.3f}s {result['stream_kb_per_capture']:>11.0f} "
+              f"{result['uploads']:>8} {per_upload:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bursts', type=int, default=3, help='number of message bursts')
+    parser.add_argument('--burst-size', type=int, default=10, help='trigger messages per burst')
+    parser.add_argument('--interval', type=float, default=3.0, help='seconds between bursts')
+    parser.add_argument('--trigger', default='btc', help='trigger word to send')
+    parser.add_argument('--freshness', type=float, default=2.0, help='FRAME_FRESHNESS_WINDOW override')
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default='polling',
+                        help='hand updates to the bot directly or POST them to the webhook server')
+    parser.add_argument('--warm-reader', action='store_true', help='enable the warm reader')
+    parser.add_argument('--segment-type', choices=['mpegts', 'fmp4'], default='mpegts',
+                        help='HLS segment container of the local stream')
+    parser.add_argument('--profile', help='capture profile to request, e.g. thumb')
+    parser.add_argument('--profiles', help='comma separated profiles to compare, one run each')
+    parser.add_argument('--backend', choices=['ffmpeg', 'pyav'], default='ffmpeg', help='CAPTURE_BACKEND override')
+    parser.add_argument('--backends', help='comma separated backends to compare, one run each')
+    parser.add_argument('--json', action='store_true', help='print the result as JSON')
+    args = parser.parse_args()
+    
+    if not shutil.which('ffmpeg'):
+        print("❌ ffmpeg is required to run the benchmark")
+        return
+    
+    if args.profiles:
+        compare_runs('profile', args.profiles.split(','))
+        return
+    if args.backends:
+        compare_runs('backend', args.backends.split(','))
+        return
+    
+    result = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,45 @@
+import asyncio
 import logging
-from telegram import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from frame_capture import FrameCaptureEngine
+import time
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from telegram import InlineQueryResultCachedPhoto, InputMediaPhoto, Message, Update
+from telegram.ext import Application, CommandHandler, InlineQueryHandler, MessageHandler, filters, ContextTypes
+from frame_capture import FrameCaptureEngine, CapturedFrame, frame_key
+from send_queue import TelegramSender
+from broadcast import BroadcastScheduler
 from config import Config
+from metrics import STAGE_SECONDS, REQUEST_SECONDS, STARTUP_SECONDS
+from stream_health import CLOSED
+from diagnostics import LoopMonitor, profile_report
+from utils import new_request_id, log_event, parse_interval, parse_time_of_day, format_age
 
 logger = logging.getLogger(__name__)
 
 class TelegramBotHandler:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, started_at: Optional[float] = None):
         self.config = config
+        # perf_counter() value the startup time metric is measured from
+        self.started_at = started_at if started_at is not None else time.perf_counter()
         self.frame_engine = FrameCaptureEngine(config)
-        self.application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+        self.sender = TelegramSender(config)
+        self.scheduler = BroadcastScheduler(config, self.frame_engine, self.deliver_frame)
+        # Background captures started by inline queries, by frame_key
+        self.inline_tasks: Dict[str, asyncio.Task] = {}
+        self.loop_monitor = LoopMonitor(config) if config.LOOP_MONITOR_ENABLED else None
+        self.profiling = False
+        # Process updates concurrently so one slow capture doesn't hold up other chats
+        builder = (
+            Application.builder()
+            .token(config.TELEGRAM_BOT_TOKEN)
+            .concurrent_updates(True)
+            .post_init(self.on_startup)
+            .post_shutdown(self.on_shutdown)
+        )
+        if config.TELEGRAM_API_BASE_URL:
+            base_url = config.TELEGRAM_API_BASE_URL.rstrip('/')
+            builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+        self.application = builder.build()
         self.setup_handlers()
     
     def setup_handlers(self):
@@ -18,11 +47,19 @@ class TelegramBotHandler:
         # Command handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
+        self.application.add_handler(CommandHandler("subscribe", self.subscribe_command))
+        self.application.add_handler(CommandHandler("unsubscribe", self.unsubscribe_command))
+        self.application.add_handler(CommandHandler("status", self.status_command))
+        self.application.add_handler(CommandHandler("at", self.at_command))
+        self.application.add_handler(CommandHandler("profile", self.profile_command))
         
         # Message handlers for trigger words
         self.application.add_handler(
             MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message)
         )
+        
+        # Inline queries ("@bot btc") answered from cached frames
+        self.application.add_handler(InlineQueryHandler(self.inline_query))
     
     def is_authorized_user(self, user_id: int) -> bool:
         """Check if user is authorized"""
@@ -39,7 +76,7 @@ class TelegramBotHandler:
         welcome_msg = (
             "🤖 YouTube Live Frame Capture Bot\n\n"
             f"Send any of these commands to capture a frame:\n"
-            f"• {', '.join(self.config.TRIGGER_COMMANDS)}\n\n"
+            f"• {', '.join(self.get_trigger_words())}\n\n"
             "Use /help for more information."
         )
         await update.message.reply_text(welcome_msg)
@@ -53,17 +90,280 @@ class TelegramBotHandler:
         help_msg = (
             "📖 **Help - YouTube Frame Capture Bot**\n\n"
             "**Available Commands:**\n"
-            f"• `{', '.join(self.config.TRIGGER_COMMANDS)}` - Capture current frame\n"
+            f"• `{', '.join(self.get_trigger_words())}` - Capture current frame\n"
+            f"• Add a profile for a different size or crop, e.g. `btc thumb` ({', '.join(self.config.CAPTURE_PROFILES)})\n"
+            f"• `clip [seconds] [gif]` - Send the last seconds as a video (up to {self.config.CLIP_MAX_SECONDS}s), e.g. `btc clip 20`\n"
+            "• `/subscribe <interval> [stream] [onchange]` - Get a frame every interval (e.g. 15m, 1h)\n"
+            "• `/unsubscribe [stream]` - Stop scheduled frames\n"
+            "• Add a time to look back instead, e.g. `btc 1h` or `btc 30m`\n"
+            "• `/at <HH:MM> [stream]` - Frame from that time today (server time)\n"
+            "• `/status` - Show stream health\n"
             "• `/start` - Show welcome message\n"
             "• `/help` - Show this help\n\n"
             "**How it works:**\n"
             "1. Send a trigger command\n"
             "2. Bot captures current frame from YouTube live stream\n"
             "3. Frame is sent as image\n\n"
-            "⚡ Response time: ~10-30 seconds"
+            "⚡ Frames captured in the last few seconds are sent at once, new captures take a few seconds"
         )
         await update.message.reply_text(help_msg, parse_mode='Markdown')
     
+    async def subscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /subscribe <interval> [stream]"""
+        if not self.is_authorized_user(update.effective_user.id):
+            await update.message.reply_text("❌ You are not authorized to use this bot.")
+            return
+        
+        chat_id = update.effective_chat.id
+        interval = parse_interval(context.args[0]) if context.args else None
+        if interval is None:
+            await update.message.reply_text(
+                "Usage: /subscribe <interval> [stream] [onchange], e.g. /subscribe 15m btc"
+            )
+            return
+        if interval < self.config.MIN_SUBSCRIPTION_INTERVAL:
+            await update.message.reply_text(
+                f"❌ The shortest interval is {self.config.MIN_SUBSCRIPTION_INTERVAL} seconds."
+            )
+            return
+        
+        options = [arg.lower() for arg in context.args[1:]]
+        only_on_change = 'onchange' in options
+        options = [arg for arg in options if arg != 'onchange']
+        stream, youtube_url = self.get_subscription_stream(options, chat_id)
+        if not youtube_url:
+            await update.message.reply_text(self.unknown_stream_message(options))
+            return
+        
+        self.scheduler.subscribe(chat_id, interval, youtube_url, stream, only_on_change)
+        log_event(
+            logger, 'subscribed', chat_id=chat_id, interval=interval,
+            youtube_url=youtube_url, only_on_change=only_on_change
+        )
+        when_changed = " when the chart has changed" if only_on_change else ""
+        await update.message.reply_text(f"✅ Sending a {stream} frame every {context.args[0]}{when_changed}.")
+    
+    async def unsubscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /unsubscribe [stream]"""
+        if not self.is_authorized_user(update.effective_user.id):
+            await update.message.reply_text("❌ You are not authorized to use this bot.")
+            return
+        
+        chat_id = update.effective_chat.id
+        youtube_url = None
+        if context.args:
+            _, youtube_url = self.get_subscription_stream(context.args, chat_id)
+            if not youtube_url:
+                await update.message.reply_text("❌ Unknown stream.")
+                return
+        
+        removed = self.scheduler.unsubscribe(chat_id, youtube_url)
+        if removed:
+            await update.message.reply_text(f"✅ Unsubscribed from {', '.join(s.stream for s in removed)}.")
+        else:
+            await update.message.reply_text("No active subscriptions.")
+    
+    async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /status: health of every configured stream"""
+        if not self.is_authorized_user(update.effective_user.id):
+            await update.message.reply_text("❌ You are not authorized to use this bot.")
+            return
+        
+        streams = self.get_configured_streams()
+        lines = ["📊 Stream status"]
+        for name, youtube_url in streams.items():
+            health = self.frame_engine.health.get(youtube_url)
+            if health.state == CLOSED and health.last_success_at is None and not health.consecutive_failures:
+                lines.append(f"\n⚪ {name}: not captured yet")
+                continue
+            
+            icon = '🟢' if health.state == CLOSED else '🔴'
+            lines.append(f"\n{icon} {name}: {health.state.replace('_', ' ')}")
+            if health.last_success_at:
+                lines.append(f"  Last success: {format_age(time.time() - health.last_success_at)} ago")
+            if health.average_latency is not None:
+                lines.append(f"  Average capture: {health.average_latency:.1f}s")
+            if health.consecutive_failures:
+                lines.append(f"  Failures in a row: {health.consecutive_failures}")
+            if health.next_probe_at and health.state != CLOSED:
+                lines.append(f"  Next check in: {format_age(health.next_probe_at - time.time())}")
+        await update.message.reply_text("\n".join(lines))
+    
+    async def at_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /at <HH:MM> [stream]"""
+        if not self.is_authorized_user(update.effective_user.id):
+            await update.message.reply_text("❌ You are not authorized to use this bot.")
+            return
+        
+        at = parse_time_of_day(context.args[0]) if context.args else None
+        if at is None:
+            await update.message.reply_text("Usage: /at <HH:MM> [stream], e.g. /at 14:30 btc")
+            return
+        _, youtube_url = self.get_subscription_stream(context.args[1:], update.effective_chat.id)
+        if not youtube_url:
+            await update.message.reply_text(self.unknown_stream_message(context.args[1:]))
+            return
+        await self.send_historical_frame(update, youtube_url, at)
+    
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /profile [seconds]: sample all threads and reply with the hottest functions (admins only)"""
+        if update.effective_user.id not in self.config.ADMIN_USER_IDS:
+            await update.message.reply_text("❌ /profile is only available to admins.")
+            return
+        if self.profiling:
+            await update.message.reply_text("⏳ A profile is already running.")
+            return
+        
+        arg = context.args[0].rstrip('s') if context.args else ''
+        seconds = int(arg) if arg.isdigit() and int(arg) > 0 else self.config.PROFILE_DEFAULT_SECONDS
+        seconds = min(seconds, self.config.PROFILE_MAX_SECONDS)
+        log_event(logger, 'profile_started', user_id=update.effective_user.id, seconds=seconds)
+        await update.message.reply_text(f"🔬 Profiling for {seconds}s...")
+        
+        self.profiling = True
+        try:
+            # The sampler runs in a worker thread, so the loop keeps serving while it is measured
+            report = await asyncio.to_thread(profile_report, seconds, self.config.PROFILE_SAMPLE_INTERVAL)
+        finally:
+            self.profiling = False
+        await update.message.reply_document(
+            document=report.encode(), filename=f"profile-{time.strftime('%Y%m%d-%H%M%S')}.txt",
+            caption=f"🔬 Hottest functions over {seconds}s"
+        )
+    
+    async def send_historical_frame(self, update: Update, youtube_url: str, at: float):
+        """Send the stored frame a stream showed at a point in time, without touching the live stream"""
+        new_request_id()
+        started = time.perf_counter()
+        chat_id = update.effective_chat.id
+        log_event(logger, 'history_requested', chat_id=chat_id, youtube_url=youtube_url, age=time.time() - at)
+        outcome = 'error'
+        
+        try:
+            frame, error = await self.frame_engine.get_historical_frame(youtube_url, at)
+            if not frame:
+                await self.sender.call(chat_id, update.message.reply_text, f"❌ {error}")
+                outcome = 'failed'
+                return
+            
+            captured = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(frame.captured_at))
+            caption = f"🕰 Frame from {captured} ({format_age(time.time() - frame.captured_at)} ago)"
+            message = await self.sender.call(
+                chat_id, update.message.reply_photo, photo=frame.file_id or frame.data, caption=caption
+            )
+            if frame.file_id is None:
+                await self.frame_engine.set_history_file_id(frame, message.photo[-1].file_id)
+            outcome = 'sent'
+        except Exception as e:
+            log_event(logger, 'request_error', logging.ERROR, error=str(e))
+            await self.sender.call(chat_id, update.message.reply_text, f"❌ An error occurred: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUEST_SECONDS.observe(elapsed, outcome=outcome)
+            log_event(logger, 'request_done', outcome=outcome, seconds=elapsed, kind='history')
+    
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer "@bot btc [profile]" with the stream's latest uploaded frame"""
+        query = update.inline_query
+        if not self.is_authorized_user(query.from_user.id):
+            await query.answer([], cache_time=0, is_personal=True)
+            return
+        
+        # An empty query offers every stream, otherwise "stream [profile]"
+        words = query.query.lower().split()
+        profile = self.config.DEFAULT_CAPTURE_PROFILE
+        if len(words) == 2 and words[1] in self.config.CAPTURE_PROFILES:
+            profile = words.pop()
+        if not words:
+            streams = self.get_configured_streams()
+        elif len(words) == 1 and self.get_stream_for_message(words[0], 0):
+            streams = {words[0]: self.get_stream_for_message(words[0], 0)}
+        else:
+            await query.answer([], cache_time=0)
+            return
+        
+        # Stale frames are still answered at once, a background capture refreshes them
+        priority = self.frame_engine.capture_scheduler.priority_for(query.from_user.id)
+        frames, missing = {}, set()
+        for name, youtube_url in streams.items():
+            frame = await self.get_inline_frame(youtube_url, profile)
+            if frame is None or frame.file_id is None:
+                task = self.start_inline_capture(youtube_url, profile, priority)
+                # Without INLINE_CACHE_CHAT_ID the capture can't produce a file_id to wait for
+                if self.config.INLINE_CACHE_CHAT_ID:
+                    missing.add(task)
+            elif frame.age > self.config.FRAME_FRESHNESS_WINDOW:
+                self.start_inline_capture(youtube_url, profile, priority)
+            frames[name] = frame
+        if missing:
+            # Streams with nothing to show yet get a short wait for their first frame
+            await asyncio.wait(missing, timeout=self.config.INLINE_ANSWER_TIMEOUT)
+        
+        results, cache_time = [], int(self.config.FRAME_FRESHNESS_WINDOW)
+        for name, frame in frames.items():
+            if frame is None or frame.file_id is None:
+                frame = await self.get_inline_frame(streams[name], profile)
+            if frame is None or frame.file_id is None:
+                cache_time = 0
+                continue
+            
+            # Telegram caches the answer until the frame is no longer fresh
+            cache_time = min(cache_time, max(0, int(self.config.FRAME_FRESHNESS_WINDOW - frame.age)))
+            results.append(InlineQueryResultCachedPhoto(
+                id=f"{name}-{profile}-{int(frame.captured_at)}", photo_file_id=frame.file_id,
+                title=name.upper(), caption=f"📸 {name.upper()} · {format_age(frame.age)} ago"
+            ))
+        
+        await query.answer(results, cache_time=cache_time)
+        log_event(
+            logger, 'inline_answered', user_id=query.from_user.id, query=query.query,
+            results=len(results), cache_time=cache_time
+        )
+    
+    async def get_inline_frame(self, youtube_url: str, profile: str) -> Optional[CapturedFrame]:
+        """Newest frame of a stream, preferring one that has a file_id"""
+        frame = self.frame_engine.get_last_good_frame(youtube_url, profile)
+        if (frame is None or frame.file_id is None) and self.frame_engine.shared_backend:
+            frame = await self.frame_engine.get_shared_frame(youtube_url, profile) or frame
+        return frame
+    
+    def start_inline_capture(self, youtube_url: str, profile: str, priority: int) -> asyncio.Task:
+        """Capture a stream in the background and upload the frame to INLINE_CACHE_CHAT_ID for its file_id"""
+        key = frame_key(youtube_url, profile)
+        task = self.inline_tasks.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self.refresh_inline_frame(youtube_url, profile, priority))
+            self.inline_tasks[key] = task
+        return task
+    
+    async def refresh_inline_frame(self, youtube_url: str, profile: str, priority: int):
+        try:
+            frame, error = await self.frame_engine.capture_and_get_frame(youtube_url, profile, priority)
+            if frame is None:
+                log_event(logger, 'inline_capture_failed', logging.WARNING, youtube_url=youtube_url, error=error)
+                return
+            # Inline results can only point at photos Telegram already has
+            if frame.file_id is None and self.config.INLINE_CACHE_CHAT_ID:
+                await self.deliver_frame(
+                    self.config.INLINE_CACHE_CHAT_ID, frame, caption=f"📸 Inline cache: {youtube_url}"
+                )
+        except Exception as e:
+            log_event(logger, 'inline_capture_failed', logging.ERROR, youtube_url=youtube_url, error=str(e))
+    
+    def get_subscription_stream(self, args: List[str], chat_id: int) -> Tuple[str, Optional[str]]:
+        """Return (name, YouTube URL) for a stream argument, or the chat's default stream"""
+        if args:
+            name = args[0].lower()
+            return name, self.config.STREAMS.get(name)
+        youtube_url = self.get_chat_stream(chat_id)
+        names = [name for name, url in self.get_configured_streams().items() if url == youtube_url]
+        return (names[0] if names else 'live'), youtube_url
+    
+    def unknown_stream_message(self, args: List[str]) -> str:
+        """Reply for a missing or unknown stream argument, listing the streams to choose from"""
+        problem = "Unknown stream." if args else "Please name a stream."
+        return f"❌ {problem} Available: {', '.join(self.config.STREAMS)}"
+    
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle incoming messages"""
         if not self.is_authorized_user(update.effective_user.id):
@@ -71,45 +371,407 @@ class TelegramBotHandler:
             return
         
         message_text = update.message.text.lower().strip()
+        words = message_text.split()
+        
+        # Generic triggers ("capture", "clip 20") need a default stream for this chat
+        if self.is_generic_trigger(words) and not self.get_chat_stream(update.effective_chat.id):
+            await update.message.reply_text(self.unknown_stream_message([]))
+            return
+        
+        # "clip 20" or "btc clip 20 gif" asks for the last seconds as a video
+        clip = self.parse_clip_request(words, update.effective_chat.id)
+        if clip:
+            if await self.within_quota(update):
+                await self.capture_and_send_clip(update, *clip)
+            return
+        
+        # Several stream words ("btc eth sol") ask for the streams side by side
+        collage = self.parse_collage_request(words)
+        if collage:
+            if await self.within_quota(update):
+                await self.capture_and_send_collage(update, collage)
+            return
+        
+        # An optional second word picks the capture profile, e.g. "btc thumb",
+        # or how far to look back in the frame history, e.g. "btc 1h"
+        profile = None
+        if len(words) == 2 and words[1] in self.config.CAPTURE_PROFILES:
+            message_text, profile = words
+        elif len(words) == 2 and parse_interval(words[1]):
+            youtube_url = self.get_stream_for_message(words[0], update.effective_chat.id)
+            if youtube_url:
+                await self.send_historical_frame(update, youtube_url, time.time() - parse_interval(words[1]))
+            return
+        
+        # Check if message matches a stream word or trigger command
+        youtube_url = self.get_stream_for_message(message_text, update.effective_chat.id)
+        if youtube_url and await self.within_quota(update):
+            await self.capture_and_send_frame(update, context, youtube_url, profile)
+    
+    async def within_quota(self, update: Update) -> bool:
+        """Take one of the user's captures, replying with when to retry if they have none left"""
+        wait = self.frame_engine.capture_scheduler.check_quota(update.effective_user.id)
+        if wait:
+            await self.sender.call(
+                update.effective_chat.id, update.message.reply_text,
+                f"⏳ Too many requests, please try again in {format_age(wait + 1)}."
+            )
+            return False
+        return True
+    
+    def parse_clip_request(self, words: List[str], chat_id: int) -> Optional[Tuple[str, float, Optional[str]]]:
+        """Return (YouTube URL, seconds, format) for "[stream] clip [seconds] [gif|mp4]" messages"""
+        if 'clip' not in words[:2]:
+            return None
+        index = words.index('clip')
+        if index == 0:
+            youtube_url = self.get_chat_stream(chat_id)
+            if not youtube_url:
+                return None
+        else:
+            youtube_url = self.get_stream_for_message(words[0], chat_id)
+            if not youtube_url:
+                return None
+        
+        clip_args = self.parse_clip_args(words[index + 1:])
+        if clip_args is None:
+            return None
+        return (youtube_url, *clip_args)
+    
+    def parse_clip_args(self, words: List[str]) -> Optional[Tuple[float, Optional[str]]]:
+        """Return (seconds, format) for the "[seconds] [gif|mp4]" words after "clip", None for anything else"""
+        seconds, clip_format = self.config.CLIP_DEFAULT_SECONDS, None
+        for word in words:
+            if word in ('gif', 'mp4'):
+                clip_format = word
+            elif word.rstrip('s').isdigit() and int(word.rstrip('s')) > 0:
+                seconds = int(word.rstrip('s'))
+            else:
+                return None
+        return seconds, clip_format
+    
+    def is_generic_trigger(self, words: List[str]) -> bool:
+        """True for a message that is only a trigger word without a stream ("capture thumb", "clip 20")"""
+        if not words or words[0] in self.config.STREAMS:
+            return False
+        if words[0] == 'clip':
+            return self.parse_clip_args(words[1:]) is not None
+        if words[0] not in [cmd.lower() for cmd in self.config.TRIGGER_COMMANDS]:
+            return False
+        return len(words) == 1 or (
+            len(words) == 2 and (words[1] in self.config.CAPTURE_PROFILES or bool(parse_interval(words[1])))
+        )
+    
+    def parse_collage_request(self, words: List[str]) -> Optional[List[str]]:
+        """Return the stream words of a message made only of two or more of them, in order"""
+        if len(words) < 2 or not all(word in self.config.STREAMS for word in words):
+            return None
+        names = list(dict.fromkeys(words))
+        if len(names) < 2:
+            return None
+        return names[:self.config.COLLAGE_MAX_STREAMS]
+    
+    def get_trigger_words(self) -> List[str]:
+        """Return stream words followed by the generic trigger commands"""
+        words = list(self.config.STREAMS)
+        words += [cmd for cmd in self.config.TRIGGER_COMMANDS if cmd.lower() not in self.config.STREAMS]
+        return words
+    
+    def get_stream_for_message(self, message_text: str, chat_id: int) -> Optional[str]:
+        """Map a trigger word to the YouTube URL it should capture"""
+        # Stream words (btc, eth, ...) always select their own stream
+        if message_text in self.config.STREAMS:
+            return self.config.STREAMS[message_text]
+        
+        if message_text not in [cmd.lower() for cmd in self.config.TRIGGER_COMMANDS]:
+            return None
         
-        # Check if message matches trigger commands
-        if message_text in [cmd.lower() for cmd in self.config.TRIGGER_COMMANDS]:
-            await self.capture_and_send_frame(update, context)
+        return self.get_chat_stream(chat_id)
+    
+    def get_chat_stream(self, chat_id: int) -> Optional[str]:
+        """Return the YouTube URL generic triggers capture in this chat, None if it is ambiguous"""
+        # Generic triggers use the chat's default stream, if one is configured
+        chat_stream = self.config.CHAT_STREAMS.get(chat_id)
+        if chat_stream:
+            return self.config.STREAMS.get(chat_stream.lower(), chat_stream)
+        # Otherwise YOUTUBE_LIVE_URL, or the only configured stream
+        streams = self.get_configured_streams()
+        if 'live' in streams:
+            return streams['live']
+        if len(streams) == 1:
+            return next(iter(streams.values()))
+        return None
+    
+    def get_configured_streams(self) -> Dict[str, str]:
+        """Streams by name, including YOUTUBE_LIVE_URL as 'live' only when it has been set"""
+        live_url = self.config.YOUTUBE_LIVE_URL
+        if live_url and 'YOUR_LIVE_STREAM_ID' not in live_url:
+            return {'live': live_url, **self.config.STREAMS}
+        return dict(self.config.STREAMS)
     
-    async def capture_and_send_frame(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def capture_and_send_frame(
+        self,
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        youtube_url: str,
+        profile: Optional[str] = None
+    ):
         """Capture frame and send to user"""
-        # Send initial status message
-        status_msg = await update.message.reply_text("📸 Capturing frame from live stream...")
+        new_request_id()
+        started = time.perf_counter()
+        if update.message.date:
+            # Delay between the user sending the trigger and the bot receiving it
+            STAGE_SECONDS.observe(max(0.0, time.time() - update.message.date.timestamp()), stage='trigger_receipt')
+        log_event(
+            logger, 'trigger_received', chat_id=update.effective_chat.id,
+            user_id=update.effective_user.id, youtube_url=youtube_url, profile=profile or 'default'
+        )
+        outcome = 'error'
+        chat_id = update.effective_chat.id
+        status_msg = None
         
         try:
             # Capture frame
-            frame_path, error = await self.frame_engine.capture_and_get_frame(
-                self.config.YOUTUBE_LIVE_URL
-            )
+            priority = self.frame_engine.capture_scheduler.priority_for(update.effective_user.id)
+            capture = asyncio.create_task(self.frame_engine.capture_and_get_frame(youtube_url, profile, priority))
             
-            if frame_path:
-                # Send image
-                await update.message.reply_photo(
-                    photo=open(frame_path, 'rb'),
-                    caption="📸 Live stream frame captured!"
+            # Cached frames arrive almost at once, only announce slower captures
+            done, _ = await asyncio.wait({capture}, timeout=self.config.STATUS_MESSAGE_DELAY)
+            if not done:
+                status_msg = await self.sender.call(
+                    chat_id, update.message.reply_text, "📸 Capturing frame from live stream..."
                 )
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='status_message')
+            frame, error = await capture
+            
+            if frame:
+                # While the stream is failing this is the last good frame, say how old it is
+                caption = None
+                if not self.frame_engine.health.allow_capture(youtube_url):
+                    caption = f"⚠️ Stream unavailable, last frame from {format_age(frame.age)} ago"
+                    outcome = 'stale'
                 
-                # Cleanup temporary file
-                self.frame_engine.cleanup_file(frame_path)
+                # Send image
+                await self.send_frame(update, frame, caption)
                 
                 # Delete status message
-                await status_msg.delete()
-                
+                if status_msg:
+                    edit_started = time.perf_counter()
+                    await self.sender.call(chat_id, status_msg.delete)
+                    STAGE_SECONDS.observe(time.perf_counter() - edit_started, stage='status_edit')
+                if outcome != 'stale':
+                    outcome = 'sent'
+            
             else:
                 # Send error message
-                error_text = f"❌ Frame capture failed:\n{error}"
-                await status_msg.edit_text(error_text)
+                await self.reply_or_edit(update, status_msg, f"❌ Frame capture failed:\n{error}")
+                outcome = 'failed'
+        
+        except Exception as e:
+            log_event(logger, 'request_error', logging.ERROR, error=str(e))
+            await self.reply_or_edit(update, status_msg, f"❌ An error occurred: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUEST_SECONDS.observe(elapsed, outcome=outcome)
+            log_event(logger, 'request_done', outcome=outcome, seconds=elapsed)
+    
+    async def capture_and_send_clip(
+        self,
+        update: Update,
+        youtube_url: str,
+        seconds: float,
+        clip_format: Optional[str] = None
+    ):
+        """Cut a clip of the last seconds of the stream and send it to the user"""
+        new_request_id()
+        started = time.perf_counter()
+        chat_id = update.effective_chat.id
+        seconds = min(seconds, self.config.CLIP_MAX_SECONDS)
+        clip_format = clip_format or self.config.CLIP_FORMAT
+        log_event(
+            logger, 'clip_requested', chat_id=chat_id, user_id=update.effective_user.id,
+            youtube_url=youtube_url, seconds=seconds, format=clip_format
+        )
+        outcome = 'error'
+        status_msg = None
+        
+        try:
+            status_msg = await self.sender.call(
+                chat_id, update.message.reply_text, f"🎬 Cutting a {seconds}s clip from the live stream..."
+            )
+            clip, error = await self.frame_engine.capture_clip(youtube_url, seconds, clip_format)
+            
+            if clip:
+                upload_started = time.perf_counter()
+                caption = f"🎬 Last {seconds}s of the live stream"
+                if clip_format == 'gif':
+                    await self.sender.call(chat_id, update.message.reply_animation, animation=clip, caption=caption)
+                else:
+                    await self.sender.call(
+                        chat_id, update.message.reply_video, video=clip, caption=caption, supports_streaming=True
+                    )
+                STAGE_SECONDS.observe(time.perf_counter() - upload_started, stage='telegram_upload_clip')
+                await self.sender.call(chat_id, status_msg.delete)
+                outcome = 'sent'
+            else:
+                await self.reply_or_edit(update, status_msg, f"❌ Clip capture failed:\n{error}")
+                outcome = 'failed'
+        
+        except Exception as e:
+            log_event(logger, 'request_error', logging.ERROR, error=str(e))
+            await self.reply_or_edit(update, status_msg, f"❌ An error occurred: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUEST_SECONDS.observe(elapsed, outcome=outcome)
+            log_event(logger, 'request_done', outcome=outcome, seconds=elapsed, kind='clip')
+    
+    async def capture_and_send_collage(self, update: Update, names: List[str]):
+        """Capture several streams at once and send them as one grid image"""
+        new_request_id()
+        started = time.perf_counter()
+        chat_id = update.effective_chat.id
+        log_event(
+            logger, 'collage_requested', chat_id=chat_id,
+            user_id=update.effective_user.id, streams=','.join(names)
+        )
+        outcome = 'error'
+        status_msg = None
+        
+        try:
+            priority = self.frame_engine.capture_scheduler.priority_for(update.effective_user.id)
+            capture = asyncio.create_task(self.frame_engine.capture_many(
+                [self.config.STREAMS[name] for name in names], self.config.COLLAGE_PROFILE, priority
+            ))
+            done, _ = await asyncio.wait({capture}, timeout=self.config.STATUS_MESSAGE_DELAY)
+            if not done:
+                status_msg = await self.sender.call(
+                    chat_id, update.message.reply_text, f"📸 Capturing {len(names)} live streams..."
+                )
+            results = await capture
+            
+            frames = [frame for frame, _ in results]
+            if not any(frames):
+                errors = '\n'.join(f"{name}: {error}" for name, (_, error) in zip(names, results))
+                await self.reply_or_edit(update, status_msg, f"❌ Frame capture failed:\n{errors}")
+                outcome = 'failed'
+                return
+            
+            # Cells of streams that failed or were late say so, rather than failing the whole collage
+            labels, notes = [], []
+            for name, (frame, error) in zip(names, results):
+                youtube_url = self.config.STREAMS[name]
+                if frame is None:
+                    labels.append(f"{name.upper()} - unavailable")
+                    notes.append(f"❌ {name}: {error}")
+                elif error or not self.frame_engine.health.allow_capture(youtube_url):
+                    labels.append(f"{name.upper()} - {format_age(frame.age)} ago")
+                    notes.append(f"⚠️ {name}: last frame from {format_age(frame.age)} ago")
+                else:
+                    labels.append(name.upper())
+            caption = '\n'.join(["📸 " + ' · '.join(name.upper() for name in names)] + notes)
+            
+            upload_started = time.perf_counter()
+            try:
+                # Imported lazily so numpy and Pillow aren't loaded at startup
+                from collage import build_collage
                 
+                image = await asyncio.to_thread(
+                    build_collage, [frame.data if frame else None for frame in frames],
+                    labels, self.config.COLLAGE_CELL_SIZE
+                )
+                STAGE_SECONDS.observe(time.perf_counter() - upload_started, stage='collage_stitch')
+            except Exception as e:
+                log_event(logger, 'collage_stitch_failed', logging.ERROR, error=str(e))
+                image = None
+            
+            upload_started = time.perf_counter()
+            captured = [frame for frame in frames if frame]
+            if image or len(captured) == 1:
+                photo = image or captured[0].file_id or captured[0].data
+                await self.sender.call(chat_id, update.message.reply_photo, photo=photo, caption=caption)
+            else:
+                # Fall back to the separate frames as an album, captioned on its first photo
+                media = [InputMediaPhoto(frame.file_id or frame.data) for frame in captured]
+                media[0] = InputMediaPhoto(media[0].media, caption=caption)
+                await self.sender.call(chat_id, update.message.reply_media_group, media=media)
+            STAGE_SECONDS.observe(time.perf_counter() - upload_started, stage='telegram_upload_collage')
+            
+            if status_msg:
+                await self.sender.call(chat_id, status_msg.delete)
+            outcome = 'sent' if not notes else 'partial'
+        
         except Exception as e:
-            logger.error(f"Error in capture_and_send_frame: {e}")
-            await status_msg.edit_text(f"❌ An error occurred: {str(e)}")
+            log_event(logger, 'request_error', logging.ERROR, error=str(e))
+            await self.reply_or_edit(update, status_msg, f"❌ An error occurred: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUEST_SECONDS.observe(elapsed, outcome=outcome)
+            log_event(logger, 'request_done', outcome=outcome, seconds=elapsed, kind='collage')
+    
+    async def reply_or_edit(self, update: Update, status_msg: Optional[Message], text: str):
+        """Show text in the status message, or as a reply when none was sent"""
+        edit_started = time.perf_counter()
+        if status_msg:
+            await self.sender.call(update.effective_chat.id, status_msg.edit_text, text)
+        else:
+            await self.sender.call(update.effective_chat.id, update.message.reply_text, text)
+        STAGE_SECONDS.observe(time.perf_counter() - edit_started, stage='status_edit')
+    
+    async def send_frame(self, update: Update, frame: CapturedFrame, caption: Optional[str] = None):
+        """Send a frame in reply to a trigger"""
+        await self.deliver_frame(update.effective_chat.id, frame, update.message.reply_photo, caption)
+    
+    async def deliver_frame(
+        self,
+        chat_id: int,
+        frame: CapturedFrame,
+        send_photo: Optional[Callable[..., Awaitable[Message]]] = None,
+        caption: Optional[str] = None
+    ):
+        """Send a frame to a chat, uploading it only once and reusing its file_id afterwards"""
+        caption = caption or "📸 Live stream frame captured!"
+        if send_photo is None:
+            send_photo = partial(self.application.bot.send_photo, chat_id=chat_id)
+        started = time.perf_counter()
+        
+        # The first chat uploads the image, chats waiting on the lock then get it by file_id
+        if frame.file_id is None:
+            async with frame.upload_lock:
+                if frame.file_id is None:
+                    message = await self.sender.call(chat_id, send_photo, photo=frame.data, caption=caption)
+                    await self.frame_engine.set_file_id(frame, message.photo[-1].file_id)
+                    STAGE_SECONDS.observe(time.perf_counter() - started, stage='telegram_upload')
+                    return
+        
+        await self.sender.call(chat_id, send_photo, photo=frame.file_id, caption=caption)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage='telegram_send_file_id')
+    
+    async def on_startup(self, application: Application):
+        """Warm up the resolver and record how long startup took"""
+        self.frame_engine.start_warm_up()
+        self.scheduler.start()
+        if self.loop_monitor:
+            self.loop_monitor.start()
+        startup_seconds = time.perf_counter() - self.started_at
+        STARTUP_SECONDS.set(startup_seconds)
+        log_event(logger, 'bot_ready', seconds=startup_seconds)
+    
+    async def on_shutdown(self, application: Application):
+        """Release capture engine resources when the bot stops"""
+        await self.scheduler.stop()
+        if self.loop_monitor:
+            await self.loop_monitor.stop()
+        for task in self.inline_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.inline_tasks.values(), return_exceptions=True)
+        await self.frame_engine.close()
     
     def run(self):
         """Start the bot"""
         logger.info("Starting Telegram bot...")
-        self.application.run_polling()
\ No newline at end of file
+        if self.config.UPDATE_MODE == 'webhook':
+            from webhook_server import WebhookServer
+            
+            asyncio.run(WebhookServer(self.config, self.application).serve())
+        else:
+            self.application.run_polling()
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Scheduled broadcasts: periodic frames pushed to subscribed chats
+"""
+
+import asyncio
+import heapq
+import json
+import os
+import time
+import logging
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from telegram.error import Forbidden
+from config import Config
+from frame_capture import FrameCaptureEngine, CapturedFrame
+from capture_scheduler import SUBSCRIPTION
+from utils import new_request_id, log_event
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Subscription:
+    chat_id: int
+    interval: int  # Seconds
+    youtube_url: str
+    stream: str  # Name shown to the user
+    only_on_change: bool = False  # Skip ticks where the frame looks like the last one sent
+
+class SubscriptionStore:
+    """Subscriptions kept in a JSON file, one per chat and stream"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.subscriptions: Dict[Tuple[int, str], Subscription] = {}
+        self.load()
+    
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                for item in json.load(f):
+                    subscription = Subscription(**item)
+                    self.subscriptions[(subscription.chat_id, subscription.youtube_url)] = subscription
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Could not load subscriptions from {self.path}: {e}")
+    
+    def save(self):
+        # Write a temp file and rename it so a crash never leaves a truncated store
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump([asdict(s) for s in self.subscriptions.values()], f, indent=2)
+        os.replace(temp_path, self.path)
+    
+    def add(self, subscription: Subscription):
+        self.subscriptions[(subscription.chat_id, subscription.youtube_url)] = subscription
+        self.save()
+    
+    def remove(self, chat_id: int, youtube_url: Optional[str] = None) -> List[Subscription]:
+        """Remove a chat's subscription to one stream, or all of them"""
+        removed = [
+            s for key, s in self.subscriptions.items()
+            if key[0] == chat_id and youtube_url in (None, key[1])
+        ]
+        for s in removed:
+            del self.subscriptions[(s.chat_id, s.youtube_url)]
+        if removed:
+            self.save()
+        return removed
+
+class BroadcastScheduler:
+    """
+    Single timer heap driving every subscription
+    
+    Subscribers are grouped by (interval, stream) and each group has one heap
+    entry. Ticks fall on multiples of the interval since the epoch, so every
+    subscriber on the same interval shares a tick, and each tick captures a
+    stream once and fans the frame out to all of its subscribers.
+    """
+    
+    def __init__(
+        self,
+        config: Config,
+        frame_engine: FrameCaptureEngine,
+        deliver_frame: Callable[[int, CapturedFrame], Awaitable[None]]
+    ):
+        self.config = config
+        self.frame_engine = frame_engine
+        self.deliver_frame = deliver_frame
+        self.store = SubscriptionStore(config.SUBSCRIPTIONS_PATH)
+        
+        # Chats per (interval, youtube_url) group and the heap of (due, interval, youtube_url)
+        self.groups: Dict[Tuple[int, str], Set[int]] = {}
+        self.heap: List[Tuple[float, int, str]] = []
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.broadcasts: Set[asyncio.Task] = set()
+        # Signature of the last frame sent per (chat_id, youtube_url), for only_on_change
+        self.last_sent: Dict[Tuple[int, str], Any] = {}
+        
+        for subscription in self.store.subscriptions.values():
+            self.add_to_group(subscription)
+    
+    @staticmethod
+    def next_tick(interval: int, now: float) -> float:
+        """First multiple of interval after now"""
+        return (now // interval + 1) * interval
+    
+    def add_to_group(self, subscription: Subscription):
+        key = (subscription.interval, subscription.youtube_url)
+        # A group has a heap entry for as long as it is in self.groups
+        if key not in self.groups:
+            self.groups[key] = set()
+            heapq.heappush(self.heap, (self.next_tick(key[0], time.time()), key[0], key[1]))
+            self.wakeup.set()
+        self.groups[key].add(subscription.chat_id)
+    
+    def remove_from_group(self, subscription: Subscription):
+        # Empty groups stay in the heap until their next tick and are dropped there
+        chats = self.groups.get((subscription.interval, subscription.youtube_url))
+        if chats:
+            chats.discard(subscription.chat_id)
+    
+    def subscribe(
+        self,
+        chat_id: int,
+        interval: int,
+        youtube_url: str,
+        stream: str,
+        only_on_change: bool = False
+    ) -> Subscription:
+        """Add or replace a chat's subscription to a stream"""
+        for old in self.store.remove(chat_id, youtube_url):
+            self.remove_from_group(old)
+        subscription = Subscription(chat_id, interval, youtube_url, stream, only_on_change)
+        self.store.add(subscription)
+        self.add_to_group(subscription)
+        return subscription
+    
+    def unsubscribe(self, chat_id: int, youtube_url: Optional[str] = None) -> List[Subscription]:
+        """Remove a chat's subscription to one stream, or all of them"""
+        removed = self.store.remove(chat_id, youtube_url)
+        for subscription in removed:
+            self.remove_from_group(subscription)
+            self.last_sent.pop((subscription.chat_id, subscription.youtube_url), None)
+        return removed
+    
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        tasks = list(self.broadcasts)
+        if self.task:
+            tasks.append(self.task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.task = None
+    
+    async def run(self):
+        """Sleep until the earliest tick, then broadcast every group that is due"""
+        while True:
+            delay = self.heap[0][0] - time.time() if self.heap else None
+            if delay is None or delay > 0:
+                # Woken early when a subscription adds an earlier tick
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                continue
+            
+            now = time.time()
+            due: Dict[str, Set[int]] = {}
+            while self.heap and self.heap[0][0] <= now:
+                _, interval, youtube_url = heapq.heappop(self.heap)
+                chats = self.groups.get((interval, youtube_url))
+                if not chats:
+                    del self.groups[(interval, youtube_url)]
+                    continue
+                due.setdefault(youtube_url, set()).update(chats)
+                heapq.heappush(self.heap, (self.next_tick(interval, now), interval, youtube_url))
+            
+            for youtube_url, chats in due.items():
+                task = asyncio.create_task(self.broadcast(youtube_url, chats))
+                self.broadcasts.add(task)
+                task.add_done_callback(self.broadcasts.discard)
+    
+    def wants_changes_only(self, chat_id: int, youtube_url: str) -> bool:
+        subscription = self.store.subscriptions.get((chat_id, youtube_url))
+        return bool(subscription and subscription.only_on_change)
+    
+    async def broadcast(self, youtube_url: str, chat_ids: Set[int]):
+        """Capture one frame of a stream and send it to every subscribed chat"""
+        new_request_id()
+        chat_ids = list(chat_ids)
+        started = time.perf_counter()
+        if not self.frame_engine.health.allow_capture(youtube_url):
+            # Subscribers would only get the same last good frame again
+            log_event(logger, 'broadcast_skipped', youtube_url=youtube_url, reason='stream_failing')
+            return
+        frame, error = await self.frame_engine.capture_and_get_frame(youtube_url, priority=SUBSCRIPTION)
+        if not frame:
+            # Subscribers just miss this tick instead of getting an error every interval
+            log_event(logger, 'broadcast_failed', logging.WARNING, youtube_url=youtube_url, error=error)
+            return
+        
+        differ = self.frame_engine.differ
+        if differ:
+            chat_ids = [
+                chat_id for chat_id in chat_ids
+                if not self.wants_changes_only(chat_id, youtube_url)
+                or differ.has_changed(self.last_sent.get((chat_id, youtube_url)), frame.signature)
+            ]
+        
+        results = await asyncio.gather(
+            *(self.deliver_frame(chat_id, frame) for chat_id in chat_ids),
+            return_exceptions=True
+        )
+        failed = 0
+        for chat_id, result in zip(chat_ids, results):
+            if isinstance(result, Forbidden):
+                # The bot was blocked or removed from the chat
+                self.unsubscribe(chat_id)
+                log_event(logger, 'subscription_dropped', chat_id=chat_id, reason=str(result))
+            elif isinstance(result, Exception):
+                failed += 1
+                log_event(logger, 'broadcast_send_failed', logging.WARNING, chat_id=chat_id, error=str(result))
+            elif self.wants_changes_only(chat_id, youtube_url):
+                self.last_sent[(chat_id, youtube_url)] = frame.signature
+        
+        log_event(
+            logger, 'broadcast_done', youtube_url=youtube_url, chats=len(chat_ids),
+            failed=failed, seconds=time.perf_counter() - started
+        )
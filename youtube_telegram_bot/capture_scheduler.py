@@ -0,0 +1,132 @@
+"""
+Capture slots handed out by priority class, and per-user capture quotas
+"""
+
+import asyncio
+import itertools
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from config import Config
+from send_queue import TokenBucket
+from metrics import STAGE_SECONDS, CAPTURE_QUEUE_DEPTH, CAPTURE_JOBS_DROPPED
+from utils import log_event
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower is served first
+ADMIN = 0
+SUBSCRIPTION = 1
+TRIGGER = 2
+PRIORITY_NAMES = {ADMIN: 'admin', SUBSCRIPTION: 'subscription', TRIGGER: 'trigger'}
+
+class CaptureWithdrawn(Exception):
+    """A queued capture was dropped because a fresh frame arrived while it waited"""
+
+@dataclass
+class QueuedCapture:
+    priority: int
+    sequence: int
+    queued_at: float
+    future: asyncio.Future = field(repr=False)
+
+class CaptureScheduler:
+    """
+    Replaces a plain semaphore around ffmpeg captures
+    
+    MAX_CONCURRENT_CAPTURES slots go to admins first, then scheduled
+    broadcasts, then ordinary triggers, in arrival order within a class.
+    Captures are coalesced per frame key before they get here, so there is at
+    most one queued capture per key and joining requests can raise its
+    priority. Ordinary triggers are turned away when CAPTURE_QUEUE_LIMIT
+    captures are already waiting, and each user has a token bucket quota.
+    """
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.free_slots = config.MAX_CONCURRENT_CAPTURES
+        self.queue: Dict[str, QueuedCapture] = {}
+        self.sequence = itertools.count()
+        self.user_buckets: Dict[int, TokenBucket] = {}
+    
+    def priority_for(self, user_id: Optional[int]) -> int:
+        return ADMIN if user_id in self.config.ADMIN_USER_IDS else TRIGGER
+    
+    def check_quota(self, user_id: int) -> float:
+        """Take one of a user's captures, returning how long to wait if none are left (admins are exempt)"""
+        if user_id in self.config.ADMIN_USER_IDS:
+            return 0.0
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            if len(self.user_buckets) >= 1000:
+                self.user_buckets = {k: b for k, b in self.user_buckets.items() if not b.is_full()}
+            bucket = TokenBucket(self.config.USER_CAPTURE_RATE / 60, self.config.USER_CAPTURE_BURST)
+            self.user_buckets[user_id] = bucket
+        wait = bucket.try_take()
+        if wait:
+            CAPTURE_JOBS_DROPPED.inc(reason='quota')
+            log_event(logger, 'quota_exceeded', user_id=user_id, retry_in=wait)
+        return wait
+    
+    def is_busy(self, priority: int) -> bool:
+        """True if a new capture of this priority would join a queue that is already full"""
+        if priority == ADMIN or self.free_slots > 0:
+            return False
+        busy = len(self.queue) >= self.config.CAPTURE_QUEUE_LIMIT
+        if busy:
+            CAPTURE_JOBS_DROPPED.inc(reason='busy')
+        return busy
+    
+    def raise_priority(self, key: str, priority: int):
+        """Move a queued capture up when a higher priority request joins it"""
+        queued = self.queue.get(key)
+        if queued and priority < queued.priority:
+            self.update_depth(queued.priority, -1)
+            queued.priority = priority
+            self.update_depth(priority, 1)
+    
+    def withdraw(self, key: str):
+        """Drop a queued capture whose requesters can be served by a frame that just arrived"""
+        queued = self.queue.pop(key, None)
+        if queued:
+            self.update_depth(queued.priority, -1)
+            queued.future.set_exception(CaptureWithdrawn())
+            CAPTURE_JOBS_DROPPED.inc(reason='served')
+            log_event(logger, 'capture_withdrawn', key=key, waited=time.monotonic() - queued.queued_at)
+    
+    async def acquire(self, key: str, priority: int):
+        """Wait for a capture slot, raising CaptureWithdrawn if the capture is no longer needed"""
+        if self.free_slots > 0 and not self.queue:
+            self.free_slots -= 1
+            STAGE_SECONDS.observe(0, stage='capture_queue')
+            return
+        
+        queued = QueuedCapture(
+            priority, next(self.sequence), time.monotonic(), asyncio.get_running_loop().create_future()
+        )
+        self.queue[key] = queued
+        self.update_depth(priority, 1)
+        try:
+            await queued.future
+        except asyncio.CancelledError:
+            if self.queue.get(key) is queued:
+                del self.queue[key]
+                self.update_depth(queued.priority, -1)
+            elif queued.future.done() and not queued.future.cancelled() and queued.future.exception() is None:
+                self.release()  # The slot was handed over as we were cancelled
+            raise
+        STAGE_SECONDS.observe(time.monotonic() - queued.queued_at, stage='capture_queue')
+    
+    def release(self):
+        """Hand the slot to the best queued capture, or free it"""
+        if not self.queue:
+            self.free_slots += 1
+            return
+        key, queued = min(self.queue.items(), key=lambda item: (item[1].priority, item[1].sequence))
+        del self.queue[key]
+        self.update_depth(queued.priority, -1)
+        queued.future.set_result(None)
+    
+    def update_depth(self, priority: int, change: int):
+        CAPTURE_QUEUE_DEPTH.inc(change, priority=PRIORITY_NAMES[priority])
@@ -0,0 +1,86 @@
+"""
+Stitch frames of several streams into one grid image
+"""
+
+import io
+import math
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+# Cells without a frame are filled with this colour
+EMPTY_CELL = (32, 32, 32)
+
+def grid_shape(count: int) -> Tuple[int, int]:
+    """Rows and columns for count cells: one row up to three, then as square as possible"""
+    columns = count if count <= 3 else math.ceil(math.sqrt(count))
+    return math.ceil(count / columns), columns
+
+def decode_cell(data: Optional[bytes], cell_size: Tuple[int, int]) -> np.ndarray:
+    """Decode a frame and fit it into a cell, letterboxed to keep its aspect ratio"""
+    width, height = cell_size
+    cell = np.empty((height, width, 3), dtype=np.uint8)
+    cell[:] = EMPTY_CELL
+    if not data:
+        return cell
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft('RGB', cell_size)
+        image = image.convert('RGB')
+        image.thumbnail(cell_size, Image.BILINEAR)
+    except Exception as e:
+        logger.warning(f"Could not decode frame for collage: {e}")
+        return cell
+    top = (height - image.height) // 2
+    left = (width - image.width) // 2
+    cell[top:top + image.height, left:left + image.width] = np.asarray(image)
+    return cell
+
+def build_collage(
+    frames: List[Optional[bytes]],
+    labels: List[str],
+    cell_size: Tuple[int, int] = (640, 360),
+    quality: int = 85
+) -> bytes:
+    """
+    Arrange frames in a grid with a label in the corner of each cell
+    
+    Args:
+        frames (List[Optional[bytes]]): Encoded frames, None for a stream that failed
+        labels (List[str]): Text drawn on each cell
+        cell_size (Tuple[int, int]): Width and height of one cell
+        quality (int): JPEG quality of the result
+    
+    Returns:
+        bytes: JPEG image of the grid
+    """
+    rows, columns = grid_shape(len(frames))
+    width, height = cell_size
+    cells = np.empty((rows * columns, height, width, 3), dtype=np.uint8)
+    cells[:] = EMPTY_CELL
+    for index, data in enumerate(frames):
+        cells[index] = decode_cell(data, cell_size)
+    
+    # (rows*columns, h, w, 3) -> (rows, h, columns, w, 3) -> one (rows*h, columns*w, 3) image
+    grid = cells.reshape(rows, columns, height, width, 3).transpose(0, 2, 1, 3, 4)
+    grid = grid.reshape(rows * height, columns * width, 3)
+    # Thin separators between cells
+    grid[height::height] = 0
+    grid[:, width::width] = 0
+    
+    image = Image.fromarray(grid)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default()
+    for index, label in enumerate(labels):
+        x = (index % columns) * width + 8
+        y = (index // columns) * height + 8
+        left, top, right, bottom = draw.textbbox((x, y), label, font=font)
+        draw.rectangle((left - 4, top - 4, right + 4, bottom + 4), fill=(0, 0, 0))
+        draw.text((x, y), label, fill=(255, 255, 255), font=font)
+    
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality)
+    return output.getvalue()
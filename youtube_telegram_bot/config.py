@@ -5,19 +5,38 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+def parse_mapping(value: str) -> dict:
+    """Parse "key=value,key=value" strings used for stream routing"""
+    mapping = {}
+    for item in value.split(','):
+        if '=' in item:
+            key, val = item.split('=', 1)
+            mapping[key.strip().lower()] = val.strip()
+    return mapping
+
 @dataclass
 class Config:
     # Telegram Bot Configuration
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
     ALLOWED_USER_IDS = [int(x) for x in os.getenv('ALLOWED_USER_IDS', '').split(',') if x]
+    # Captures of admins are served first and skip quotas. Admins must be listed here,
+    # ALLOWED_USER_IDS only decides who may use the bot
+    ADMIN_USER_IDS = [int(x) for x in os.getenv('ADMIN_USER_IDS', '').split(',') if x]
+    TELEGRAM_API_BASE_URL = os.getenv('TELEGRAM_API_BASE_URL')  # e.g. a local Bot API server, defaults to api.telegram.org
     
     # YouTube Configuration
     YOUTUBE_LIVE_URL = os.getenv('YOUTUBE_LIVE_URL', 'https://youtube.com/watch?v=YOUR_LIVE_STREAM_ID')
     
+    # Extra streams by trigger word, e.g. "btc=https://youtube.com/...,eth=https://..."
+    STREAMS = parse_mapping(os.getenv('STREAMS', ''))
+    # Stream used by generic triggers per chat, e.g. "-1001234567890=eth"
+    CHAT_STREAMS = {int(k): v for k, v in parse_mapping(os.getenv('CHAT_STREAMS', '')).items()}
+    
     # Trigger Commands
     TRIGGER_COMMANDS = ['btc', 'capture', 'frame']
     
     # File Management
+    CAPTURE_OUTPUT_MODE = os.getenv('CAPTURE_OUTPUT_MODE', 'memory')  # 'memory' or 'file' (keeps frames in TEMP_DIR for debugging)
     TEMP_DIR = 'temp_frames'
     IMAGE_FORMAT = 'jpg'
     IMAGE_QUALITY = 85
@@ -26,9 +45,156 @@ class Config:
     YTDLP_TIMEOUT = 30
     FFMPEG_TIMEOUT = 20
     
+    # Concurrency
+    MAX_CONCURRENT_CAPTURES = int(os.getenv('MAX_CONCURRENT_CAPTURES', '4'))  # One-off ffmpeg captures across all streams
+    RESOLVER_WORKERS = int(os.getenv('RESOLVER_WORKERS', '4'))
+    CAPTURE_QUEUE_LIMIT = int(os.getenv('CAPTURE_QUEUE_LIMIT', '20'))  # Waiting captures before triggers get a busy reply
+    USER_CAPTURE_RATE = float(os.getenv('USER_CAPTURE_RATE', '6'))  # Triggers per minute per user
+    USER_CAPTURE_BURST = 3
+    
+    # Resolved stream URL cache (seconds)
+    STREAM_URL_DEFAULT_TTL = 1800  # Used when the URL carries no expire= parameter
+    STREAM_URL_REFRESH_MARGIN = 600  # Refresh in the background this long before expiry
+    
+    # Triggers within this many seconds of a capture reuse its frame
+    FRAME_FRESHNESS_WINDOW = float(os.getenv('FRAME_FRESHNESS_WINDOW', '2'))
+    
+    # Change detection on a small grayscale thumbnail (needs numpy and Pillow)
+    FRAME_CHANGE_DETECTION = os.getenv('FRAME_CHANGE_DETECTION', 'true').lower() == 'true'
+    FRAME_DIFF_SIZE = (64, 36)  # Thumbnail width, height
+    FRAME_DIFF_PIXEL_DELTA = 24  # Brightness change (0-255) that counts a pixel as changed
+    FRAME_CHANGE_THRESHOLD = 0.003  # Share of changed pixels above which the frame changed
+    
+    # Frame history for look-backs ("btc 1h", "/at 14:30"); frames that look
+    # unchanged from the previous one are not stored again
+    FRAME_HISTORY_ENABLED = os.getenv('FRAME_HISTORY_ENABLED', 'true').lower() == 'true'
+    FRAME_HISTORY_PATH = os.getenv('FRAME_HISTORY_PATH', 'frame_history.db')
+    FRAME_HISTORY_MAX_AGE = int(os.getenv('FRAME_HISTORY_MAX_AGE', str(3 * 24 * 3600)))  # Seconds
+    FRAME_HISTORY_MAX_BYTES = int(os.getenv('FRAME_HISTORY_MAX_MB', '200')) * 1024 * 1024
+    FRAME_HISTORY_EVICT_INTERVAL = 300  # Seconds between age checks
+    FRAME_HISTORY_MAX_GAP = 900  # Look-backs before a stream's first stored frame use it only if it is this close
+    
+    # Circuit breaker: after this many failed captures in a row a stream is
+    # treated as offline and probed in the background with exponential back-off
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))
+    CIRCUIT_PROBE_INTERVAL = 30  # Seconds until the first probe
+    CIRCUIT_MAX_PROBE_INTERVAL = 600
+    
+    # Warm reader: keep ffmpeg decoding the stream and serve the latest frame
+    WARM_READER_ENABLED = os.getenv('WARM_READER_ENABLED', 'false').lower() == 'true'
+    WARM_READER_FPS = float(os.getenv('WARM_READER_FPS', '1'))
+    WARM_READER_BUFFER_FRAMES = 3
+    MAX_WARM_READERS = int(os.getenv('MAX_WARM_READERS', '8'))  # Further streams use one-off captures
+    WARM_READER_IDLE_TIMEOUT = int(os.getenv('WARM_READER_IDLE_TIMEOUT', '600'))  # Stop after this long without requests
+    WARM_READER_BACKOFF = 2  # First restart delay, doubled after each failed restart
+    WARM_READER_MAX_BACKOFF = 60
+    
+    # Clips ("btc clip 20"): cut from a rolling buffer of the stream's HLS segments
+    CLIP_DEFAULT_SECONDS = 10
+    CLIP_MAX_SECONDS = 30
+    CLIP_BUFFER_SECONDS = 45  # Stream kept in memory per buffered stream
+    CLIP_BUFFER_IDLE_TIMEOUT = int(os.getenv('CLIP_BUFFER_IDLE_TIMEOUT', '600'))  # Stop buffering after this long without clips
+    CLIP_PROFILE = 'thumb'  # Capture profile whose stream variant clips are cut from
+    CLIP_FORMAT = os.getenv('CLIP_FORMAT', 'mp4')  # 'mp4' or 'gif'
+    CLIP_FPS = 10
+    CLIP_WIDTH = 640
+    CLIP_ENCODE_WORKERS = int(os.getenv('CLIP_ENCODE_WORKERS', '1'))  # Separate from MAX_CONCURRENT_CAPTURES
+    CLIP_ENCODE_TIMEOUT = 60
+    
+    # Collages ("btc eth sol"): streams captured side by side into one image
+    COLLAGE_DEADLINE = float(os.getenv('COLLAGE_DEADLINE', '8'))  # Slower streams use their last frame
+    COLLAGE_MAX_STREAMS = 9
+    COLLAGE_PROFILE = 'thumb'  # Capture profile of each cell
+    COLLAGE_CELL_SIZE = (640, 360)
+    
+    # Inline mode ("@bot btc", enable it with BotFather's /setinline). Inline
+    # answers can only reference uploaded photos, so frames captured for an
+    # inline query are uploaded to this chat (e.g. a private channel) first.
+    INLINE_CACHE_CHAT_ID = int(os.getenv('INLINE_CACHE_CHAT_ID', '0')) or None
+    INLINE_ANSWER_TIMEOUT = 3  # Seconds an inline query waits for a stream with no uploaded frame
+    
+    # Scheduled broadcasts (/subscribe)
+    SUBSCRIPTIONS_PATH = os.getenv('SUBSCRIPTIONS_PATH', 'subscriptions.json')
+    MIN_SUBSCRIPTION_INTERVAL = 60  # Seconds
+    
+    # Outbound Telegram limits (messages per second), calls beyond them are queued
+    TELEGRAM_GLOBAL_RATE = 30
+    TELEGRAM_CHAT_RATE = 1
+    TELEGRAM_GROUP_RATE = 20 / 60
+    TELEGRAM_CHAT_BURST = 3
+    SEND_MAX_RETRIES = 3  # Retries after a RetryAfter flood error
+    # Only show "Capturing..." when the frame takes longer than this (0 = always)
+    STATUS_MESSAGE_DELAY = float(os.getenv('STATUS_MESSAGE_DELAY', '1'))
+    
+    # Update delivery: 'polling' or 'webhook'
+    UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling')
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Public URL registered with Telegram, e.g. https://bot.example.com/telegram
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+    WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')  # Required, updates without it are refused
+    WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '200'))  # Further updates get HTTP 429
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '16'))
+    WEBHOOK_MAX_CONNECTIONS = 40  # Concurrent connections Telegram may open to us
+    
+    # State shared between bot replicas: '' (off), 'memory' (single process) or 'sqlite'
+    SHARED_BACKEND = os.getenv('SHARED_BACKEND', '').lower()
+    SHARED_BACKEND_PATH = os.getenv('SHARED_BACKEND_PATH', 'shared_state.db')
+    SHARED_POLL_INTERVAL = 0.25  # How often followers check for the leader's frame
+    
+    # Prometheus-style /metrics endpoint (set METRICS_PORT=0 to disable)
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+    
+    # Event loop watchdog: logs the loop's stack when it is blocked longer than the threshold
+    LOOP_MONITOR_ENABLED = os.getenv('LOOP_MONITOR_ENABLED', 'true').lower() == 'true'
+    LOOP_LAG_INTERVAL = 0.5  # Seconds between lag measurements
+    LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.25'))
+    # Admin /profile <seconds> sampling profiler
+    PROFILE_DEFAULT_SECONDS = 10
+    PROFILE_MAX_SECONDS = 60
+    PROFILE_SAMPLE_INTERVAL = 0.005
+    
+    # How frames are captured: 'ffmpeg' (a subprocess per capture) or 'pyav'
+    # (HLS segments fetched and decoded in-process, needs the av package)
+    CAPTURE_BACKEND = os.getenv('CAPTURE_BACKEND', 'ffmpeg').lower()
+    
     # FFmpeg Configuration
+    # Limits of ffmpeg children (captures, warm readers and clip encodes); 0 picks a default
+    FFMPEG_MAX_PROCESSES = int(os.getenv('FFMPEG_MAX_PROCESSES', '0'))  # Captures + clip workers + warm readers
+    FFMPEG_THREADS = int(os.getenv('FFMPEG_THREADS', '0'))  # Available CPUs / MAX_CONCURRENT_CAPTURES
+    FFMPEG_MEMORY_LIMIT_MB = int(os.getenv('FFMPEG_MEMORY_LIMIT_MB', '1024'))  # Address space per child, 0 = unlimited
+    FFMPEG_NICE = int(os.getenv('FFMPEG_NICE', '10'))  # Lower priority than the bot itself
     FFMPEG_OPTIONS = {
         'vframes': 1,
-        'q:v': 2,
-        'vf': 'scale=1280:720'  # Resize to 720p
-    }
\ No newline at end of file
+    }
+    
+    # Capture profiles, chosen by adding the name after a trigger ("btc thumb").
+    # vf is the ffmpeg filter chain, height the smallest stream variant worth
+    # capturing from, q:v the JPEG quality (2 best - 31) and quality the WebP
+    # quality (0-100); keyframes_only skips decoding other frames.
+    CHART_CROP = os.getenv('CHART_CROP', 'iw*0.8:ih*0.9:0:ih*0.05')  # ffmpeg crop w:h:x:y of the chart area
+    CAPTURE_PROFILES = {
+        'full': {
+            'vf': 'scale=1280:720:flags=fast_bilinear', 'height': 720,
+            'q:v': 2, 'format': 'jpg', 'keyframes_only': True
+        },
+        'thumb': {
+            'vf': 'scale=640:360:flags=fast_bilinear', 'height': 360,
+            'q:v': 5, 'format': 'jpg', 'keyframes_only': True
+        },
+        'chart': {
+            'vf': f'crop={CHART_CROP},scale=1280:-2:flags=fast_bilinear', 'height': 1080,
+            'q:v': 3, 'format': 'jpg', 'keyframes_only': True
+        },
+        'webp': {
+            'vf': 'scale=1280:720:flags=fast_bilinear', 'height': 720,
+            'quality': 80, 'format': 'webp', 'keyframes_only': True
+        },
+    }
+    DEFAULT_CAPTURE_PROFILE = os.getenv('DEFAULT_CAPTURE_PROFILE', 'full')
+    
+    # Stream variant selection
+    VARIANT_LATENCY_ALPHA = 0.3  # Weight of the newest sample in the latency moving average
+    VARIANT_FAILURE_COOLDOWN = 300  # Seconds a failed variant is avoided
+    MAX_VARIANT_ATTEMPTS = 2  # Variants tried per capture before giving up
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Event loop lag monitoring and an on-demand sampling profiler
+"""
+
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+import logging
+from typing import Dict, Optional, Tuple
+from config import Config
+from metrics import LOOP_LAG_SECONDS, SLOW_CALLBACKS
+from utils import log_event
+
+logger = logging.getLogger(__name__)
+
+class LoopMonitor:
+    """
+    Measures event loop lag and reports what blocked the loop
+    
+    A task sleeps for LOOP_LAG_INTERVAL and records how late it woke up. A
+    watchdog thread checks the task's heartbeat, and when the loop has been
+    stuck for longer than LOOP_LAG_THRESHOLD it logs the loop thread's stack,
+    which points at the blocking call while it is still running.
+    """
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.loop_thread_id: Optional[int] = None
+        self.heartbeat = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self.watchdog: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+    
+    def start(self):
+        """Start monitoring the running event loop"""
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.stopped.clear()
+        self.task = asyncio.create_task(self.run())
+        self.watchdog = threading.Thread(target=self.watch, name='loop-watchdog', daemon=True)
+        self.watchdog.start()
+    
+    async def run(self):
+        interval = self.config.LOOP_LAG_INTERVAL
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            self.heartbeat = now
+            lag = max(0.0, now - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.config.LOOP_LAG_THRESHOLD:
+                log_event(logger, 'loop_lag', logging.WARNING, seconds=lag)
+    
+    def watch(self):
+        """Watchdog thread: log the loop's stack once per stall"""
+        reported = None
+        while not self.stopped.wait(self.config.LOOP_LAG_THRESHOLD / 2):
+            heartbeat = self.heartbeat
+            blocked = time.monotonic() - heartbeat - self.config.LOOP_LAG_INTERVAL
+            if blocked <= self.config.LOOP_LAG_THRESHOLD or reported == heartbeat:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame else 'unavailable'
+            SLOW_CALLBACKS.inc()
+            log_event(logger, 'loop_blocked', logging.WARNING, seconds=blocked, stack=stack)
+    
+    async def stop(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+def sample_stacks(seconds: float, interval: float) -> Tuple[Dict[str, int], Dict[str, int], int]:
+    """
+    Sample the stacks of all other threads
+    
+    Args:
+        seconds (float): How long to sample for
+        interval (float): Seconds between samples
+    
+    Returns:
+        Tuple[Dict[str, int], Dict[str, int], int]: Samples per function at the
+        top of a stack, samples per function anywhere in a stack, and the number of samples
+    """
+    own = collections.Counter()
+    total = collections.Counter()
+    samples = 0
+    me = threading.get_ident()
+    names = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread in threading.enumerate():
+            names.setdefault(thread.ident, thread.name)
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            thread = names.get(thread_id, str(thread_id))
+            seen = set()
+            top = True
+            while frame is not None:
+                code = frame.f_code
+                function = f"{code.co_name} ({code.co_filename}:{code.co_firstlineno}) [{thread}]"
+                if top:
+                    own[function] += 1
+                    top = False
+                if function not in seen:
+                    # Recursive functions count once per sample
+                    seen.add(function)
+                    total[function] += 1
+                frame = frame.f_back
+        samples += 1
+        time.sleep(interval)
+    return own, total, samples
+
+def profile_report(seconds: float, interval: float, top: int = 40) -> str:
+    """Sample all threads for a while and format the hottest functions as text"""
+    started = time.monotonic()
+    own, total, samples = sample_stacks(seconds, interval)
+    elapsed = time.monotonic() - started
+    lines = [
+        f"Sampled all threads every {interval * 1000:.0f}ms for {elapsed:.1f}s ({samples} samples)",
+        "Threads waiting in select(), wait() or acquire() are idle.",
+        "",
+        f"Top {top} by own samples (function on top of the stack):",
+    ]
+    for function, count in own.most_common(top):
+        lines.append(f"{count / max(samples, 1):7.1%}  {count:6d}  {function}")
+    lines += ["", f"Top {top} by total samples (function anywhere on the stack):"]
+    for function, count in total.most_common(top):
+        lines.append(f"{count / max(samples, 1):7.1%}  {count:6d}  {function}")
+    return '\n'.join(lines) + '\n'
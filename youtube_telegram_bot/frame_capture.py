@@ -1,90 +1,394 @@
-import subprocess
+import asyncio
 import tempfile
 import os
+import time
+import socket
+import uuid
 import logging
-from typing import Optional, Tuple
-import yt_dlp
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
 from config import Config
+from stream_resolver import StreamResolver, StreamVariant, variants_to_json, variants_from_json
+from variant_selector import VariantSelector
+from utils import parse_stream_url_expiry, is_stream_url_rejected, is_hls_url, cleanup_temp_directory, log_event
+from warm_reader import WarmStreamReader
+from shared_backend import create_shared_backend
+from stream_health import StreamHealthTracker
+from capture_scheduler import CaptureScheduler, CaptureWithdrawn, TRIGGER
+from frame_history import FrameHistory, HistoricalFrame
+from process_governor import ProcessGovernor
+from metrics import (
+    STAGE_SECONDS, CACHE_HITS, CACHE_MISSES, COALESCED_REQUESTS,
+    CAPTURE_FAILURES, CAPTURES_IN_FLIGHT, UNCHANGED_FRAMES, CIRCUIT_OPEN_REQUESTS
+)
 
 logger = logging.getLogger(__name__)
 
+# ffmpeg encoders used when piping an image of a given IMAGE_FORMAT to stdout
+IMAGE_CODECS = {
+    'jpg': 'mjpeg',
+    'jpeg': 'mjpeg',
+    'png': 'png',
+    'webp': 'libwebp',
+}
+
+def frame_key(youtube_url: str, profile: str) -> str:
+    """Key frames of a stream are cached and shared under, one per capture profile"""
+    return f"{youtube_url}#{profile}"
+
+@dataclass
+class CachedStream:
+    variants: List[StreamVariant]
+    expires_at: float
+
+@dataclass
+class CapturedFrame:
+    data: bytes
+    captured_at: float
+    youtube_url: str = ''
+    profile: str = ''
+    # Telegram file_id once the frame has been uploaded, later sends reuse it
+    file_id: Optional[str] = None
+    upload_lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False, compare=False)
+    # Grayscale thumbnail from FrameDiffer and whether it differs from the previous frame
+    signature: Any = field(default=None, repr=False, compare=False)
+    changed: bool = True
+    
+    @property
+    def age(self) -> float:
+        return time.time() - self.captured_at
+    
+    @property
+    def key(self) -> str:
+        return frame_key(self.youtube_url, self.profile)
+
 class FrameCaptureEngine:
     def __init__(self, config: Config):
         self.config = config
-        self.ensure_temp_dir()
+        if config.CAPTURE_OUTPUT_MODE == 'file':
+            self.ensure_temp_dir()
+            cleanup_temp_directory(config.TEMP_DIR)
+        
+        # yt-dlp is blocking, so resolution runs in a bounded thread pool
+        self.resolver = StreamResolver(config)
+        self.resolver_executor = ThreadPoolExecutor(
+            max_workers=config.RESOLVER_WORKERS,
+            thread_name_prefix='yt-dlp'
+        )
+        # Limits how many ffmpeg captures may run at the same time across all
+        # streams. Captures are coalesced per stream, so each stream queues at
+        # most one waiter, and waiters are served by priority class.
+        self.capture_scheduler = CaptureScheduler(config)
+        # Every ffmpeg child (captures, warm readers, clips) is started through
+        # the governor, which caps their number and limits their resources
+        self.process_governor = ProcessGovernor(config)
+        
+        # Resolved stream variants keyed by YouTube URL, and which variant to use per profile
+        self.stream_url_cache: Dict[str, CachedStream] = {}
+        self.resolve_tasks: Dict[str, asyncio.Task] = {}
+        self.variant_selector = VariantSelector(config)
+        
+        # Latest frame and in-flight capture per stream and profile (frame_key), shared by all triggers
+        self.latest_frames: Dict[str, CapturedFrame] = {}
+        self.capture_tasks: Dict[str, asyncio.Task] = {}
+        self.capture_priorities: Dict[str, int] = {}
+        
+        # Capture outcomes per stream; failing streams are answered from the last
+        # good frame while a background probe waits for them to recover
+        self.health = StreamHealthTracker(config, self.probe_stream)
+        
+        # Long-running ffmpeg readers per YouTube URL (WARM_READER_ENABLED)
+        self.warm_readers: Dict[str, WarmStreamReader] = {}
+        
+        # Recent HLS segments per YouTube URL that clips are cut from. Clip
+        # encodes take longer than captures and have their own limit, so they
+        # never hold a capture slot.
+        self.segment_buffers: Dict[str, Any] = {}
+        self.clip_semaphore = asyncio.Semaphore(config.CLIP_ENCODE_WORKERS)
+        
+        # Frames, file_ids and stream URLs shared with other replicas (SHARED_BACKEND),
+        # the capture lease makes one replica the leader per stream
+        self.shared_backend = create_shared_backend(config)
+        self.replica_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        
+        # Every captured frame that changed is kept on disk for look-backs
+        self.history = FrameHistory(config) if config.FRAME_HISTORY_ENABLED else None
+        self.history_writes: Set[asyncio.Task] = set()
+        
+        # Imported lazily so PyAV is only needed with the pyav backend
+        self.hls_capture = None
+        if config.CAPTURE_BACKEND == 'pyav':
+            from hls_capture import HlsFrameCapture
+            
+            self.hls_capture = HlsFrameCapture(config)
+        
+        # Imported lazily so numpy and Pillow are only needed with change detection on
+        self.differ = None
+        if config.FRAME_CHANGE_DETECTION:
+            from frame_diff import FrameDiffer
+            
+            self.differ = FrameDiffer(config)
     
     def ensure_temp_dir(self):
         """Create temporary directory if it doesn't exist"""
         os.makedirs(self.config.TEMP_DIR, exist_ok=True)
     
-    def get_live_stream_url(self, youtube_url: str) -> Optional[str]:
-        """Extract actual stream URL using yt-dlp"""
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
-            'format': 'best[ext=mp4]/best',
-            'socket_timeout': self.config.YTDLP_TIMEOUT,
-        }
+    def get_live_stream_variants(self, youtube_url: str) -> Optional[List[StreamVariant]]:
+        """Extract the stream's variants using yt-dlp"""
+        return self.resolver.resolve(youtube_url)
+    
+    def start_warm_up(self):
+        """Prepare the yt-dlp resolver in the background"""
+        self.resolver_executor.submit(self.resolver.warm_up)
+    
+    async def resolve_stream_variants(self, youtube_url: str) -> Optional[List[StreamVariant]]:
+        """Resolve stream variants without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.resolver_executor, self.get_live_stream_variants, youtube_url
+        )
+    
+    async def get_stream_variants(self, youtube_url: str) -> Optional[List[StreamVariant]]:
+        """Return cached stream variants, resolving them only when missing or expired"""
+        cached = self.stream_url_cache.get(youtube_url)
+        now = time.time()
+        
+        if cached and now < cached.expires_at:
+            CACHE_HITS.inc(cache='stream_url')
+            if now >= cached.expires_at - self.config.STREAM_URL_REFRESH_MARGIN:
+                # Still valid, refresh in the background before it expires
+                self.start_resolve(youtube_url)
+            return cached.variants
         
+        CACHE_MISSES.inc(cache='stream_url')
+        return await asyncio.shield(self.start_resolve(youtube_url))
+    
+    async def get_stream_variant(
+        self,
+        youtube_url: str,
+        profile: str = '',
+        exclude: Sequence[str] = ()
+    ) -> Optional[StreamVariant]:
+        """Return the variant to capture a profile from, skipping format_ids in exclude"""
+        variants = await self.get_stream_variants(youtube_url)
+        if not variants:
+            return None
+        min_height = self.get_profile(profile).get('height')
+        return self.variant_selector.choose(youtube_url, variants, min_height, exclude)
+    
+    async def get_stream_url(self, youtube_url: str, profile: str = '') -> Optional[str]:
+        """Return the URL of the variant to capture a profile from"""
+        variant = await self.get_stream_variant(youtube_url, profile)
+        return variant.url if variant else None
+    
+    def start_resolve(self, youtube_url: str) -> asyncio.Task:
+        """Start resolving a stream URL unless a resolution is already running"""
+        task = self.resolve_tasks.get(youtube_url)
+        if task is None:
+            task = asyncio.create_task(self.resolve_and_cache(youtube_url))
+            self.resolve_tasks[youtube_url] = task
+        return task
+    
+    async def resolve_and_cache(self, youtube_url: str) -> Optional[List[StreamVariant]]:
+        """Resolve a stream's variants and store them with their expiry time"""
+        try:
+            # Another replica may have resolved it already (shared as the JSON encoded variant list)
+            if self.shared_backend:
+                shared = await self.shared_call(self.shared_backend.get_stream_url, youtube_url)
+                if shared and time.time() < shared[1] - self.config.STREAM_URL_REFRESH_MARGIN:
+                    CACHE_HITS.inc(cache='shared_stream_url')
+                    variants = variants_from_json(shared[0])
+                    self.stream_url_cache[youtube_url] = CachedStream(variants, shared[1])
+                    return variants
+            
+            started = time.perf_counter()
+            variants = await self.resolve_stream_variants(youtube_url)
+            elapsed = time.perf_counter() - started
+            STAGE_SECONDS.observe(elapsed, stage='resolve')
+            
+            if variants:
+                # Variant URLs of one resolution share the same expiry
+                expires_at = parse_stream_url_expiry(variants[0].url)
+                if expires_at is None:
+                    expires_at = time.time() + self.config.STREAM_URL_DEFAULT_TTL
+                self.stream_url_cache[youtube_url] = CachedStream(variants, expires_at)
+                if self.shared_backend:
+                    await self.shared_call(
+                        self.shared_backend.put_stream_url, youtube_url, variants_to_json(variants), expires_at
+                    )
+                log_event(
+                    logger, 'stream_resolved', youtube_url=youtube_url, variants=len(variants),
+                    seconds=elapsed, valid_for=int(expires_at - time.time())
+                )
+            return variants
+        finally:
+            self.resolve_tasks.pop(youtube_url, None)
+    
+    async def invalidate_stream_url(self, youtube_url: str, stream_url: str):
+        """Drop a resolution whose variant URL was rejected so the next capture resolves again"""
+        cached = self.stream_url_cache.get(youtube_url)
+        # Another capture may already have replaced it with a fresh resolution
+        if cached and any(v.url == stream_url for v in cached.variants):
+            del self.stream_url_cache[youtube_url]
+            if self.shared_backend:
+                await self.shared_call(
+                    self.shared_backend.delete_stream_url, youtube_url, variants_to_json(cached.variants)
+                )
+    
+    async def shared_call(self, method: Callable, *args, default: Any = None) -> Any:
+        """Call a shared backend method off the event loop, returning default if it fails"""
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(youtube_url, download=False)
-                if info and 'url' in info:
-                    return info['url']
-                else:
-                    logger.error("No stream URL found")
-                    return None
+            return await asyncio.to_thread(method, *args)
         except Exception as e:
-            logger.error(f"yt-dlp error: {e}")
-            return None
+            log_event(logger, 'shared_backend_failed', logging.WARNING, call=method.__name__, error=str(e))
+            return default
+    
+    def get_profile(self, profile: str) -> dict:
+        """Settings of a capture profile, falling back to the default profile"""
+        profiles = self.config.CAPTURE_PROFILES
+        return profiles.get(profile) or profiles[self.config.DEFAULT_CAPTURE_PROFILE]
+    
+    def build_ffmpeg_command(self, stream_url: str, profile: str, output: list) -> list:
+        """Build the ffmpeg command capturing one frame with a profile's settings"""
+        settings = self.get_profile(profile)
+        
+        input_options = []
+        if is_hls_url(stream_url):
+            # Start at the newest segment rather than three segments back. Its
+            # first frame is a keyframe already, and skipping the frames after
+            # it would stall probing until the next segment is published.
+            input_options += ['-live_start_index', '-1']
+        elif settings.get('keyframes_only'):
+            # Only keyframes are decoded, the first one is the frame we keep
+            input_options += ['-skip_frame', 'nokey']
+        
+        if 'quality' in settings:
+            quality = ['-quality', str(settings['quality'])]  # libwebp, 0-100
+        else:
+            quality = ['-q:v', str(settings.get('q:v', 2))]  # mjpeg, 2 (best) to 31
+        
+        return [
+            'ffmpeg',
+            '-loglevel', 'error',
+            '-threads', str(self.process_governor.threads),
+            *input_options,
+            '-i', stream_url,
+            '-vframes', str(self.config.FFMPEG_OPTIONS['vframes']),
+            '-vf', settings['vf'],
+            *quality,
+        ] + output
     
-    def capture_frame(self, stream_url: str) -> Tuple[Optional[str], Optional[str]]:
-        """Capture frame using ffmpeg"""
+    async def capture_frame(self, stream_url: str, profile: str = '') -> Tuple[Optional[bytes], Optional[str]]:
+        """Capture a single encoded frame using an ffmpeg subprocess"""
+        if self.hls_capture and is_hls_url(stream_url):
+            # The in-process backend only reads HLS, other inputs still go to ffmpeg
+            CAPTURES_IN_FLIGHT.inc()
+            try:
+                return await self.hls_capture.capture(stream_url, self.get_profile(profile))
+            finally:
+                CAPTURES_IN_FLIGHT.dec()
+        
+        frame_path = None
+        image_format = self.get_profile(profile).get('format', self.config.IMAGE_FORMAT)
+        CAPTURES_IN_FLIGHT.inc()
         try:
-            # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(
-                suffix=f'.{self.config.IMAGE_FORMAT}',
-                dir=self.config.TEMP_DIR,
-                delete=False
-            )
-            temp_file.close()
+            # ffmpeg writes the image to stdout, file output is kept for debugging
+            if self.config.CAPTURE_OUTPUT_MODE == 'file':
+                frame_path = self.create_frame_path(image_format)
+                output = ['-y', frame_path]
+            else:
+                codec = IMAGE_CODECS.get(image_format, 'mjpeg')
+                output = ['-f', 'image2pipe', '-c:v', codec, 'pipe:1']
             
             # Build ffmpeg command
-            cmd = [
-                'ffmpeg',
-                '-i', stream_url,
-                '-vframes', str(self.config.FFMPEG_OPTIONS['vframes']),
-                '-q:v', str(self.config.FFMPEG_OPTIONS['q:v']),
-                '-vf', self.config.FFMPEG_OPTIONS['vf'],
-                '-y',  # Overwrite output file
-                temp_file.name
-            ]
+            cmd = self.build_ffmpeg_command(stream_url, profile, output)
             
-            # Execute ffmpeg command
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=self.config.FFMPEG_TIMEOUT
-            )
+            # Execute ffmpeg command, the governor kills it if it outlives the timeout
+            started = time.perf_counter()
+            async with self.process_governor.spawn(
+                'capture', cmd, cpu_seconds=self.config.FFMPEG_TIMEOUT * self.process_governor.threads,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            ) as process:
+                spawned = time.perf_counter()
+                data, stderr, first_byte_at = await asyncio.wait_for(
+                    self.read_process_output(process),
+                    timeout=self.config.FFMPEG_TIMEOUT
+                )
+            finished = time.perf_counter()
+            if first_byte_at:
+                STAGE_SECONDS.observe(first_byte_at - spawned, stage='ffmpeg_first_byte')
+                STAGE_SECONDS.observe(finished - first_byte_at, stage='ffmpeg_encode')
             
-            if result.returncode == 0 and os.path.exists(temp_file.name):
-                return temp_file.name, None
-            else:
-                error_msg = f"FFmpeg failed: {result.stderr}"
-                logger.error(error_msg)
-                self.cleanup_file(temp_file.name)
+            if process.returncode != 0:
+                error_msg = f"FFmpeg failed: {stderr.decode(errors='replace')}"
+                reason = 'url_rejected' if is_stream_url_rejected(error_msg) else 'ffmpeg'
+                CAPTURE_FAILURES.inc(reason=reason)
+                log_event(logger, 'capture_failed', logging.ERROR, reason=reason, error=error_msg.strip())
+                if frame_path:
+                    self.cleanup_file(frame_path)
                 return None, error_msg
-                
-        except subprocess.TimeoutExpired:
+            
+            if frame_path:
+                log_event(logger, 'frame_written', logging.DEBUG, path=frame_path)
+                with open(frame_path, 'rb') as f:
+                    data = f.read()
+            
+            if not data:
+                CAPTURE_FAILURES.inc(reason='no_frame')
+                return None, "FFmpeg produced no frame"
+            
+            log_event(logger, 'capture_done', profile=profile, seconds=finished - started, bytes=len(data))
+            return data, None
+        
+        except asyncio.TimeoutError:
             error_msg = "Frame capture timed out"
-            logger.error(error_msg)
+            CAPTURE_FAILURES.inc(reason='timeout')
+            log_event(logger, 'capture_failed', logging.ERROR, reason='timeout', timeout=self.config.FFMPEG_TIMEOUT)
+            if frame_path:
+                self.cleanup_file(frame_path)
             return None, error_msg
         except Exception as e:
             error_msg = f"Frame capture error: {e}"
-            logger.error(error_msg)
+            CAPTURE_FAILURES.inc(reason='error')
+            log_event(logger, 'capture_failed', logging.ERROR, reason='error', error=str(e))
+            if frame_path:
+                self.cleanup_file(frame_path)
             return None, error_msg
+        finally:
+            CAPTURES_IN_FLIGHT.dec()
+    
+    async def read_process_output(self, process: asyncio.subprocess.Process) -> Tuple[bytes, bytes, Optional[float]]:
+        """Read ffmpeg output to EOF, noting when the first stdout byte arrived"""
+        stderr_task = asyncio.create_task(process.stderr.read())
+        chunks = []
+        first_byte_at = None
+        try:
+            while True:
+                chunk = await process.stdout.read(65536)
+                if not chunk:
+                    break
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                chunks.append(chunk)
+            stderr = await stderr_task
+        finally:
+            stderr_task.cancel()
+        
+        await process.wait()
+        return b''.join(chunks), stderr, first_byte_at
+    
+    def create_frame_path(self, image_format: str) -> str:
+        """Create a file in TEMP_DIR for ffmpeg to write the frame to"""
+        temp_file = tempfile.NamedTemporaryFile(
+            suffix=f'.{image_format}',
+            dir=self.config.TEMP_DIR,
+            delete=False
+        )
+        temp_file.close()
+        return temp_file.name
     
     def cleanup_file(self, file_path: str):
         """Remove temporary file"""
@@ -92,19 +396,534 @@ class FrameCaptureEngine:
             if os.path.exists(file_path):
                 os.remove(file_path)
         except Exception as e:
-            logger.warning(f"Failed to cleanup file {file_path}: {e}")
+            log_event(logger, 'cleanup_failed', logging.WARNING, path=file_path, error=str(e))
     
-    async def capture_and_get_frame(self, youtube_url: str) -> Tuple[Optional[str], Optional[str]]:
+    async def capture_and_get_frame(
+        self,
+        youtube_url: str,
+        profile: Optional[str] = None,
+        priority: int = TRIGGER
+    ) -> Tuple[Optional[CapturedFrame], Optional[str]]:
         """Main method to capture frame from YouTube live stream"""
-        # Step 1: Get actual stream URL
-        logger.info("Resolving YouTube live stream URL...")
-        stream_url = self.get_live_stream_url(youtube_url)
+        if profile not in self.config.CAPTURE_PROFILES:
+            profile = self.config.DEFAULT_CAPTURE_PROFILE
+        key = frame_key(youtube_url, profile)
+        
+        # A frame captured moments ago is served as-is
+        latest = self.latest_frames.get(key)
+        if latest and latest.age <= self.config.FRAME_FRESHNESS_WINDOW:
+            if latest.file_id is None and self.shared_backend:
+                # Another replica may have uploaded it in the meantime
+                latest = await self.get_shared_frame(youtube_url, profile) or latest
+            CACHE_HITS.inc(cache='frame')
+            log_event(logger, 'frame_cache_hit', youtube_url=youtube_url, age=latest.age)
+            return latest, None
+        
+        # So is a frame another replica captured moments ago
+        if self.shared_backend:
+            frame = await self.get_shared_frame(youtube_url, profile)
+            if frame and frame.age <= self.config.FRAME_FRESHNESS_WINDOW:
+                CACHE_HITS.inc(cache='shared')
+                log_event(logger, 'shared_frame_hit', youtube_url=youtube_url, age=frame.age)
+                return frame, None
+        
+        # A warm reader serves its latest decoded frame without spawning ffmpeg
+        # (it decodes with the default profile's settings)
+        if self.config.WARM_READER_ENABLED and profile == self.config.DEFAULT_CAPTURE_PROFILE:
+            frame = self.get_warm_frame(youtube_url)
+            if frame:
+                CACHE_HITS.inc(cache='warm_reader')
+                log_event(logger, 'warm_reader_hit', youtube_url=youtube_url, age=frame.age)
+                return frame, None
+        
+        # A stream that keeps failing is not captured until its probe succeeds
+        if not self.health.allow_capture(youtube_url):
+            CIRCUIT_OPEN_REQUESTS.inc()
+            frame = self.get_last_good_frame(youtube_url, profile)
+            log_event(
+                logger, 'circuit_open_answer', youtube_url=youtube_url,
+                age=frame.age if frame else None
+            )
+            if frame:
+                return frame, None
+            return None, "Stream appears to be offline. It is checked again in the background."
+        
+        # Join a capture that is already running instead of starting another one
+        if key in self.capture_tasks:
+            COALESCED_REQUESTS.inc()
+            log_event(logger, 'capture_joined', youtube_url=youtube_url)
+        elif self.capture_scheduler.is_busy(priority):
+            log_event(logger, 'capture_busy', logging.WARNING, youtube_url=youtube_url)
+            return None, "The bot is busy right now, please try again in a few seconds."
+        else:
+            CACHE_MISSES.inc(cache='frame')
+        return await asyncio.shield(self.start_capture(youtube_url, profile, priority))
+    
+    async def capture_many(
+        self,
+        youtube_urls: List[str],
+        profile: Optional[str] = None,
+        priority: int = TRIGGER,
+        deadline: Optional[float] = None
+    ) -> List[Tuple[Optional[CapturedFrame], Optional[str]]]:
+        """
+        Capture several streams concurrently, giving up on slow ones at a deadline
+        
+        Args:
+            youtube_urls (List[str]): Streams to capture
+            profile (Optional[str]): Capture profile used for every stream
+            priority (int): Scheduler priority class of the captures
+            deadline (Optional[float]): Seconds to wait, COLLAGE_DEADLINE if not given
         
+        Returns:
+            List[Tuple[Optional[CapturedFrame], Optional[str]]]: Frame and error per stream, in order.
+            A stream that missed the deadline gets its last good frame, if any, along with an error.
+        """
+        if profile not in self.config.CAPTURE_PROFILES:
+            profile = self.config.DEFAULT_CAPTURE_PROFILE
+        deadline = self.config.COLLAGE_DEADLINE if deadline is None else deadline
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(self.capture_and_get_frame(url, profile, priority)) for url in youtube_urls]
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        # Captures themselves are shielded, so they keep running and refresh the cache for next time
+        for task in pending:
+            task.cancel()
+        
+        results = []
+        for url, task in zip(youtube_urls, tasks):
+            if task in done:
+                try:
+                    results.append(task.result())
+                except Exception as e:
+                    results.append((None, f"Frame capture error: {e}"))
+            else:
+                results.append((self.get_last_good_frame(url, profile), "No new frame within the deadline"))
+        log_event(
+            logger, 'capture_many_done', streams=len(tasks), late=len(pending),
+            failed=sum(1 for frame, _ in results if frame is None), seconds=time.perf_counter() - started
+        )
+        return results
+    
+    def start_capture(self, youtube_url: str, profile: str, priority: int = TRIGGER) -> asyncio.Task:
+        """Start capturing a stream and profile unless a capture is already running"""
+        key = frame_key(youtube_url, profile)
+        task = self.capture_tasks.get(key)
+        if task is None:
+            self.capture_priorities[key] = priority
+            task = asyncio.create_task(self.run_capture(youtube_url, profile))
+            self.capture_tasks[key] = task
+        elif priority < self.capture_priorities.get(key, TRIGGER):
+            # A more important request joined, move the queued capture up
+            self.capture_priorities[key] = priority
+            self.capture_scheduler.raise_priority(key, priority)
+        return task
+    
+    async def probe_stream(self, youtube_url: str):
+        """Capture a failing stream to check whether it has recovered"""
+        await asyncio.shield(self.start_capture(youtube_url, self.config.DEFAULT_CAPTURE_PROFILE))
+    
+    def get_last_good_frame(self, youtube_url: str, profile: str) -> Optional[CapturedFrame]:
+        """Newest frame held for a stream, preferring the requested profile"""
+        frame = self.latest_frames.get(frame_key(youtube_url, profile))
+        if frame:
+            return frame
+        frames = [f for f in self.latest_frames.values() if f.youtube_url == youtube_url]
+        return max(frames, key=lambda f: f.captured_at, default=None)
+    
+    def get_warm_frame(self, youtube_url: str) -> Optional[CapturedFrame]:
+        """Return the warm reader's newest frame, starting the reader if needed"""
+        reader = self.warm_readers.get(youtube_url)
+        if reader is None or not reader.running:
+            # Streams beyond the reader budget keep using one-off captures
+            running = sum(1 for r in self.warm_readers.values() if r.running)
+            if running >= self.config.MAX_WARM_READERS:
+                return None
+        
+        if reader is None:
+            reader = WarmStreamReader(
+                self.config, youtube_url, self.get_stream_url, self.invalidate_stream_url, self.process_governor
+            )
+            self.warm_readers[youtube_url] = reader
+        
+        latest = reader.latest_frame()
+        if latest is None:
+            return None  # Still warming up, fall back to a one-off capture
+        
+        captured_at, data = latest
+        max_age = max(self.config.FRAME_FRESHNESS_WINDOW, 2 / self.config.WARM_READER_FPS)
+        if time.time() - captured_at > max_age:
+            return None  # Reader is stalled or restarting
+        
+        # Hand out the same object for the same decoded frame so its file_id is reused
+        profile = self.config.DEFAULT_CAPTURE_PROFILE
+        current = self.latest_frames.get(frame_key(youtube_url, profile))
+        if current and current.captured_at == captured_at:
+            return current
+        
+        # The thumbnail is decoded inline (about a millisecond) so concurrent
+        # triggers can't create two objects for the same frame
+        signature = self.differ.signature(data) if self.differ else None
+        frame = self.store_frame(youtube_url, profile, data, captured_at, signature)
+        self.record_history(frame)
+        return frame
+    
+    def store_frame(
+        self,
+        youtube_url: str,
+        profile: str,
+        data: bytes,
+        captured_at: float,
+        signature: Any = None
+    ) -> CapturedFrame:
+        """Publish a frame as the stream's latest, noting whether it changed since the previous one"""
+        frame = CapturedFrame(
+            data=data, captured_at=captured_at, youtube_url=youtube_url,
+            profile=profile, signature=signature
+        )
+        previous = self.latest_frames.get(frame.key)
+        if previous and previous.captured_at >= captured_at:
+            return previous  # A newer frame was stored while this one was being processed
+        
+        if self.differ and previous and not self.differ.has_changed(previous.signature, signature):
+            # Same picture, so the image already on Telegram can be sent again.
+            # Keeping the uploaded frame's signature compares later frames
+            # against it, so slow drift adds up instead of passing unnoticed
+            frame.changed = False
+            frame.file_id = previous.file_id
+            frame.signature = previous.signature
+            UNCHANGED_FRAMES.inc()
+        self.latest_frames[frame.key] = frame
+        # A capture of this key still waiting for a slot has nothing left to do
+        self.capture_scheduler.withdraw(frame.key)
+        return frame
+    
+    async def frame_signature(self, data: bytes) -> Any:
+        """Compute a frame's change detection thumbnail off the event loop"""
+        if self.differ is None:
+            return None
+        return await asyncio.to_thread(self.differ.signature, data)
+    
+    def record_history(self, frame: CapturedFrame):
+        """Append a frame captured here to the history in the background"""
+        if not self.history or not frame.changed:
+            return
+        task = asyncio.create_task(self.write_history(frame))
+        self.history_writes.add(task)
+        task.add_done_callback(self.history_writes.discard)
+    
+    async def write_history(self, frame: CapturedFrame):
+        try:
+            await asyncio.to_thread(
+                self.history.add, frame.youtube_url, frame.profile, frame.data, frame.captured_at
+            )
+        except Exception as e:
+            log_event(logger, 'history_write_failed', logging.WARNING, youtube_url=frame.youtube_url, error=str(e))
+    
+    async def get_historical_frame(self, youtube_url: str, at: float) -> Tuple[Optional[HistoricalFrame], Optional[str]]:
+        """
+        Look up the stored frame a stream showed at a point in time
+        
+        Args:
+            youtube_url (str): YouTube live stream URL
+            at (float): Unix timestamp
+        
+        Returns:
+            Tuple[Optional[HistoricalFrame], Optional[str]]: Frame and error message
+        """
+        if not self.history:
+            return None, "Frame history is disabled."
+        started = time.perf_counter()
+        try:
+            frame = await asyncio.to_thread(self.history.nearest, youtube_url, at)
+        except Exception as e:
+            log_event(logger, 'history_lookup_failed', logging.ERROR, youtube_url=youtube_url, error=str(e))
+            return None, f"Frame history error: {e}"
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage='history_lookup')
+        if frame is None:
+            return None, "No frame was stored around that time."
+        return frame, None
+    
+    async def set_history_file_id(self, frame: HistoricalFrame, file_id: str):
+        if self.history and frame.file_id is None:
+            frame.file_id = file_id
+            await asyncio.to_thread(self.history.set_file_id, frame.id, file_id)
+    
+    async def get_shared_frame(self, youtube_url: str, profile: str) -> Optional[CapturedFrame]:
+        """Return the newest frame published by any replica, adopting it locally"""
+        key = frame_key(youtube_url, profile)
+        shared = await self.shared_call(self.shared_backend.get_frame, key)
+        if shared is None:
+            return None
+        
+        current = self.latest_frames.get(key)
+        if current and current.captured_at >= shared.captured_at:
+            # Same frame we already hold, pick up a file_id another replica got for it
+            if current.captured_at == shared.captured_at and current.file_id is None:
+                current.file_id = shared.file_id
+            return current
+        
+        signature = await self.frame_signature(shared.data)
+        frame = self.store_frame(youtube_url, profile, shared.data, shared.captured_at, signature)
+        if shared.file_id and frame.captured_at == shared.captured_at:
+            frame.file_id = shared.file_id
+        return frame
+    
+    async def set_file_id(self, frame: CapturedFrame, file_id: str):
+        """Remember the Telegram file_id of an uploaded frame and share it with other replicas"""
+        frame.file_id = file_id
+        if self.shared_backend and frame.youtube_url:
+            await self.shared_call(self.shared_backend.set_file_id, frame.key, frame.captured_at, file_id)
+    
+    async def run_capture(self, youtube_url: str, profile: str) -> Tuple[Optional[CapturedFrame], Optional[str]]:
+        """Resolve the stream, capture a frame and publish it as the latest frame"""
+        key = frame_key(youtube_url, profile)
+        started = time.perf_counter()
+        try:
+            if self.shared_backend:
+                frame, error = await self.run_shared_capture(youtube_url, profile)
+            else:
+                frame, error = await self.run_local_capture(youtube_url, profile)
+        except CaptureWithdrawn:
+            # A fresh frame arrived while the capture was queued, it serves everyone waiting
+            return self.latest_frames.get(key), None
+        finally:
+            self.capture_tasks.pop(key, None)
+            self.capture_priorities.pop(key, None)
+        
+        if frame:
+            self.health.record_success(youtube_url, time.perf_counter() - started)
+        else:
+            self.health.record_failure(youtube_url, error)
+        return frame, error
+    
+    async def run_local_capture(self, youtube_url: str, profile: str) -> Tuple[Optional[CapturedFrame], Optional[str]]:
+        """Capture a frame in this process"""
+        data, error = await self.capture_from_youtube(youtube_url, profile)
+        if not data:
+            return None, error
+        
+        captured_at = time.time()
+        frame = self.store_frame(youtube_url, profile, data, captured_at, await self.frame_signature(data))
+        self.record_history(frame)
+        return frame, None
+    
+    async def run_shared_capture(self, youtube_url: str, profile: str) -> Tuple[Optional[CapturedFrame], Optional[str]]:
+        """Capture as the stream's leader, or wait for the leader's frame as a follower"""
+        backend = self.shared_backend
+        key = frame_key(youtube_url, profile)
+        # Long enough for a resolve and a capture retried after a rejected URL
+        lease_ttl = self.config.YTDLP_TIMEOUT + 2 * self.config.FFMPEG_TIMEOUT
+        deadline = time.monotonic() + lease_ttl
+        
+        # If the backend is unreachable every replica captures for itself
+        while not await self.shared_call(
+            backend.try_acquire_lease, key, self.replica_id, lease_ttl, default=True
+        ):
+            await asyncio.sleep(self.config.SHARED_POLL_INTERVAL)
+            frame = await self.get_shared_frame(youtube_url, profile)
+            if frame and frame.age <= self.config.FRAME_FRESHNESS_WINDOW:
+                CACHE_HITS.inc(cache='shared')
+                log_event(logger, 'shared_frame_received', youtube_url=youtube_url, age=frame.age)
+                return frame, None
+            if time.monotonic() >= deadline:
+                CAPTURE_FAILURES.inc(reason='leader_timeout')
+                return None, "Timed out waiting for another replica to capture the frame"
+        
+        try:
+            data, error = await self.capture_from_youtube(youtube_url, profile)
+            if not data:
+                return None, error
+            
+            captured_at = time.time()
+            frame = self.store_frame(youtube_url, profile, data, captured_at, await self.frame_signature(data))
+            self.record_history(frame)
+            await self.shared_call(backend.put_frame, key, frame.data, frame.captured_at)
+            if frame.file_id:
+                await self.shared_call(backend.set_file_id, key, frame.captured_at, frame.file_id)
+            return frame, None
+        finally:
+            await self.shared_call(backend.release_lease, key, self.replica_id)
+    
+    async def capture_from_youtube(self, youtube_url: str, profile: str = '') -> Tuple[Optional[bytes], Optional[str]]:
+        """Resolve the YouTube URL and capture a single frame"""
+        log_event(logger, 'capture_started', youtube_url=youtube_url, profile=profile)
+        tried = []
+        resolved_again = False
+        data, error = None, None
+        
+        while len(tried) < self.config.MAX_VARIANT_ATTEMPTS:
+            # Step 1: Pick the stream variant to capture from
+            variant = await self.get_stream_variant(youtube_url, profile, exclude=tried)
+            if not variant:
+                if tried:
+                    break  # Every variant failed, report the last error
+                CAPTURE_FAILURES.inc(reason='resolve')
+                return None, "Failed to resolve YouTube stream URL. Stream might be offline."
+            
+            # Step 2: Capture frame once a capture slot is free
+            key = frame_key(youtube_url, profile)
+            await self.capture_scheduler.acquire(key, self.capture_priorities.get(key, TRIGGER))
+            try:
+                started = time.perf_counter()
+                data, error = await self.capture_frame(variant.url, profile)
+                elapsed = time.perf_counter() - started
+                STAGE_SECONDS.observe(elapsed, stage='capture')
+            finally:
+                self.capture_scheduler.release()
+            
+            if data:
+                self.variant_selector.record_success(youtube_url, variant, elapsed)
+                log_event(
+                    logger, 'variant_captured', youtube_url=youtube_url, variant=variant.label,
+                    tbr=variant.tbr or 0, seconds=elapsed,
+                    average=self.variant_selector.get_latency(youtube_url, variant)
+                )
+                return data, None
+            
+            # Step 3: The cached URLs may have expired early, resolve again and retry once
+            if is_stream_url_rejected(error) and not resolved_again:
+                resolved_again = True
+                log_event(logger, 'stream_url_rejected', youtube_url=youtube_url)
+                await self.invalidate_stream_url(youtube_url, variant.url)
+                continue
+            
+            # Otherwise fall back to the next variant
+            self.variant_selector.record_failure(youtube_url, variant)
+            log_event(logger, 'variant_failed', logging.WARNING, youtube_url=youtube_url, variant=variant.label)
+            tried.append(variant.format_id)
+        
+        return data, error
+    
+    async def get_clip_stream_url(self, youtube_url: str) -> Optional[str]:
+        return await self.get_stream_url(youtube_url, self.config.CLIP_PROFILE)
+    
+    def build_clip_command(self, offset: float, seconds: float, clip_format: str, output_path: str) -> list:
+        """Build the ffmpeg command encoding buffered segments from stdin into a clip"""
+        scale = f"fps={self.config.CLIP_FPS},scale={self.config.CLIP_WIDTH}:-2:flags=fast_bilinear"
+        if clip_format == 'gif':
+            # A palette generated from the clip itself keeps chart colours accurate
+            encode = [
+                '-filter_complex', f'{scale},split[a][b];[a]palettegen=stats_mode=diff[p];[b][p]paletteuse=dither=bayer',
+            ]
+        else:
+            encode = [
+                '-vf', scale,
+                '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28',
+                '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+            ]
+        return [
+            'ffmpeg',
+            '-loglevel', 'error',
+            '-i', 'pipe:0',
+            '-ss', f'{offset:.3f}',
+            '-t', f'{seconds:.3f}',
+            '-an',
+            '-threads', str(self.process_governor.threads),
+            *encode,
+            '-y', output_path,
+        ]
+    
+    async def capture_clip(
+        self,
+        youtube_url: str,
+        seconds: float,
+        clip_format: Optional[str] = None
+    ) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Encode the last seconds of a live stream from its segment buffer
+        
+        Args:
+            youtube_url (str): YouTube live stream URL
+            seconds (float): Clip length, capped at CLIP_MAX_SECONDS
+            clip_format (Optional[str]): 'mp4' or 'gif', CLIP_FORMAT by default
+        
+        Returns:
+            Tuple[Optional[bytes], Optional[str]]: Encoded clip and error message
+        """
+        clip_format = clip_format or self.config.CLIP_FORMAT
+        seconds = min(seconds, self.config.CLIP_MAX_SECONDS)
+        log_event(logger, 'clip_started', youtube_url=youtube_url, seconds=seconds, format=clip_format)
+        
+        stream_url = await self.get_clip_stream_url(youtube_url)
         if not stream_url:
             return None, "Failed to resolve YouTube stream URL. Stream might be offline."
+        if not is_hls_url(stream_url):
+            return None, "Clips are only available for HLS live streams."
+        
+        # Step 1: Take the newest segments from the buffer, filling it on first use
+        buffer = self.segment_buffers.get(youtube_url)
+        if buffer is None:
+            # Imported lazily so aiohttp is only loaded once a clip is asked for
+            from segment_buffer import SegmentBuffer
+            
+            buffer = SegmentBuffer(self.config, youtube_url, self.get_clip_stream_url, self.invalidate_stream_url)
+            self.segment_buffers[youtube_url] = buffer
+        started = time.perf_counter()
+        recent = await buffer.get_recent(seconds)
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage='clip_buffer')
+        if not recent:
+            return None, "Could not download the stream's recent segments."
+        data, offset = recent
         
-        # Step 2: Capture frame
-        logger.info("Capturing frame from stream...")
-        frame_path, error = self.capture_frame(stream_url)
+        # Step 2: Encode them, at most CLIP_ENCODE_WORKERS at a time
+        self.ensure_temp_dir()
+        output_path = self.create_frame_path(clip_format)
+        try:
+            async with self.clip_semaphore:
+                started = time.perf_counter()
+                async with self.process_governor.spawn(
+                    'clip', self.build_clip_command(offset, seconds, clip_format, output_path),
+                    cpu_seconds=self.config.CLIP_ENCODE_TIMEOUT * self.process_governor.threads,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                ) as process:
+                    _, stderr = await asyncio.wait_for(
+                        process.communicate(data), timeout=self.config.CLIP_ENCODE_TIMEOUT
+                    )
+                elapsed = time.perf_counter() - started
+                STAGE_SECONDS.observe(elapsed, stage='clip_encode')
+            
+            if process.returncode != 0:
+                error = stderr.decode(errors='replace').strip()
+                log_event(logger, 'clip_failed', logging.ERROR, youtube_url=youtube_url, error=error)
+                return None, f"FFmpeg failed: {error}"
+            
+            with open(output_path, 'rb') as f:
+                clip = f.read()
+            if not clip:
+                return None, "FFmpeg produced an empty clip"
+            
+            log_event(
+                logger, 'clip_done', youtube_url=youtube_url, seconds=seconds,
+                format=clip_format, encode_seconds=elapsed, bytes=len(clip)
+            )
+            return clip, None
         
-        return frame_path, error
\ No newline at end of file
+        except asyncio.TimeoutError:
+            log_event(logger, 'clip_failed', logging.ERROR, youtube_url=youtube_url, reason='timeout')
+            return None, "Clip encoding timed out"
+        except Exception as e:
+            log_event(logger, 'clip_failed', logging.ERROR, youtube_url=youtube_url, error=str(e))
+            return None, f"Clip encoding error: {e}"
+        finally:
+            self.cleanup_file(output_path)
+    
+    async def close(self):
+        """Release background resources"""
+        await self.health.stop()
+        if self.hls_capture:
+            await self.hls_capture.close()
+        for reader in self.warm_readers.values():
+            await reader.stop()
+        self.warm_readers.clear()
+        for buffer in self.segment_buffers.values():
+            await buffer.stop()
+        self.segment_buffers.clear()
+        self.resolver_executor.shutdown(wait=False, cancel_futures=True)
+        self.resolver.close()
+        if self.shared_backend:
+            self.shared_backend.close()
+        if self.history:
+            await asyncio.gather(*self.history_writes, return_exceptions=True)
+            self.history.close()
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+Persistent history of captured frames for look-backs ("btc 1h", "/at 14:30")
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from config import Config
+from utils import log_event
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class HistoricalFrame:
+    id: int
+    youtube_url: str
+    captured_at: float
+    data: bytes
+    file_id: Optional[str] = None
+
+class FrameHistory:
+    """
+    Append-only SQLite store of frames, indexed by (stream, captured_at)
+    
+    Nearest-frame lookups are two index seeks, so they stay O(log n) however
+    long the history grows. Frames older than FRAME_HISTORY_MAX_AGE are
+    evicted, and the oldest frames go first once the store is larger than
+    FRAME_HISTORY_MAX_BYTES.
+    """
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            config.FRAME_HISTORY_PATH, timeout=10, check_same_thread=False, isolation_level=None
+        )
+        # Lets eviction hand freed pages back to the filesystem (only takes effect on a new file)
+        self.db.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS frames (
+                id INTEGER PRIMARY KEY, youtube_url TEXT NOT NULL, profile TEXT NOT NULL,
+                captured_at REAL NOT NULL, size INTEGER NOT NULL, data BLOB NOT NULL, file_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS frames_by_time ON frames (youtube_url, captured_at);
+        ''')
+        self.total_bytes = self.execute('SELECT COALESCE(SUM(size), 0) FROM frames').fetchone()[0]
+        self.last_evicted = 0.0
+    
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self.lock:
+            return self.db.execute(sql, params)
+    
+    def add(self, youtube_url: str, profile: str, data: bytes, captured_at: float):
+        """Append a frame, evicting old ones when the store is over its limits"""
+        self.execute(
+            'INSERT INTO frames (youtube_url, profile, captured_at, size, data) VALUES (?, ?, ?, ?, ?)',
+            (youtube_url, profile, captured_at, len(data), data)
+        )
+        self.total_bytes += len(data)
+        if (
+            self.total_bytes > self.config.FRAME_HISTORY_MAX_BYTES
+            or time.time() - self.last_evicted > self.config.FRAME_HISTORY_EVICT_INTERVAL
+        ):
+            self.evict()
+    
+    def nearest(self, youtube_url: str, at: float) -> Optional[HistoricalFrame]:
+        """
+        Find the frame a stream was showing at a time
+        
+        Unchanged frames are not stored, so the latest frame captured at or
+        before the time is what the stream showed then, however long ago it
+        was stored. Only before the stream's first stored frame does the look-up
+        fall back to the next frame, if it is within FRAME_HISTORY_MAX_GAP.
+        
+        Args:
+            youtube_url (str): Stream the frame belongs to
+            at (float): Unix timestamp to look up
+        
+        Returns:
+            Optional[HistoricalFrame]: Frame shown at that time, or None if there is none
+        """
+        columns = 'id, youtube_url, captured_at, data, file_id'
+        row = self.execute(
+            f'SELECT {columns} FROM frames WHERE youtube_url = ? AND captured_at <= ? '
+            'ORDER BY captured_at DESC LIMIT 1', (youtube_url, at)
+        ).fetchone()
+        if row is None:
+            row = self.execute(
+                f'SELECT {columns} FROM frames WHERE youtube_url = ? AND captured_at > ? '
+                'ORDER BY captured_at ASC LIMIT 1', (youtube_url, at)
+            ).fetchone()
+            if row is None or row[2] - at > self.config.FRAME_HISTORY_MAX_GAP:
+                return None
+        return HistoricalFrame(row[0], row[1], row[2], bytes(row[3]), row[4])
+    
+    def set_file_id(self, frame_id: int, file_id: str):
+        """Remember a stored frame's Telegram file_id so later look-backs skip the upload"""
+        self.execute('UPDATE frames SET file_id = ? WHERE id = ?', (file_id, frame_id))
+    
+    def evict(self):
+        """Delete frames past FRAME_HISTORY_MAX_AGE, then the oldest while over FRAME_HISTORY_MAX_BYTES"""
+        self.last_evicted = time.time()
+        cutoff = self.last_evicted - self.config.FRAME_HISTORY_MAX_AGE
+        deleted = 0
+        # Ids grow with insertion time, so walking them finds the oldest frames first
+        while True:
+            rows = self.execute(
+                'SELECT id, size FROM frames WHERE captured_at < ? ORDER BY id LIMIT 500', (cutoff,)
+            ).fetchall()
+            if not rows:
+                break
+            deleted += self.delete(rows)
+        
+        # Shrink to 90% of the limit so the next few frames don't evict again
+        target = self.config.FRAME_HISTORY_MAX_BYTES * 0.9
+        while self.total_bytes > target:
+            rows = self.execute('SELECT id, size FROM frames ORDER BY id LIMIT 100').fetchall()
+            if not rows:
+                break
+            deleted += self.delete(rows)
+        
+        if deleted:
+            self.execute('PRAGMA incremental_vacuum')
+            log_event(logger, 'history_evicted', frames=deleted, total_bytes=self.total_bytes)
+    
+    def delete(self, rows: list) -> int:
+        placeholders = ','.join('?' * len(rows))
+        self.execute(f'DELETE FROM frames WHERE id IN ({placeholders})', tuple(row[0] for row in rows))
+        self.total_bytes -= sum(row[1] for row in rows)
+        return len(rows)
+    
+    def close(self):
+        with self.lock:
+            self.db.close()
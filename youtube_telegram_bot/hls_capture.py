@@ -0,0 +1,191 @@
+"""
+In-process capture backend: fetch the newest HLS segment and decode its first keyframe with PyAV
+"""
+
+import asyncio
+import io
+import time
+import logging
+from typing import Dict, Optional, Tuple
+import aiohttp
+import av
+from config import Config
+from segment_buffer import parse_playlist
+from metrics import STAGE_SECONDS, CAPTURE_FAILURES, CAPTURE_BYTES_DOWNLOADED
+from utils import log_event
+
+logger = logging.getLogger(__name__)
+
+# PIL encoder names per IMAGE_FORMAT
+PIL_FORMATS = {
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'webp': 'WEBP',
+}
+
+class HlsFrameCapture:
+    """
+    Captures frames without spawning ffmpeg (CAPTURE_BACKEND=pyav)
+    
+    Playlists and segments are fetched over one keep-alive HTTP session, and
+    only the newest segment is downloaded. Its first frame is a keyframe, so
+    decoding stops after one frame. The profile's vf chain runs through
+    libavfilter as it would in ffmpeg, and Pillow encodes the result.
+    """
+    
+    # Try decoding a partially downloaded segment every this many bytes,
+    # MPEG-TS keyframes usually decode well before the segment ends
+    DECODE_STEP = 256 * 1024
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.session: Optional[aiohttp.ClientSession] = None
+        # fMP4 init segments by URL, they don't change while a stream runs
+        self.init_segments: Dict[str, bytes] = {}
+    
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.config.FFMPEG_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit_per_host=self.config.MAX_CONCURRENT_CAPTURES * 2)
+            )
+        return self.session
+    
+    async def fetch(self, url: str) -> bytes:
+        async with self.get_session().get(url) as response:
+            if response.status >= 400:
+                # Worded like ffmpeg's errors so is_stream_url_rejected() recognises them
+                raise RuntimeError(f"HTTP error {response.status} {response.reason}")
+            data = await response.read()
+        CAPTURE_BYTES_DOWNLOADED.inc(len(data), backend='pyav')
+        return data
+    
+    async def capture(self, stream_url: str, settings: dict) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Capture one encoded frame from an HLS media playlist
+        
+        Args:
+            stream_url (str): Resolved HLS playlist URL
+            settings (dict): Capture profile from CAPTURE_PROFILES
+        
+        Returns:
+            Tuple[Optional[bytes], Optional[str]]: Encoded image and error message
+        """
+        started = time.perf_counter()
+        try:
+            playlist = parse_playlist((await self.fetch(stream_url)).decode(errors='replace'), stream_url)
+            if playlist.variant_url:
+                stream_url = playlist.variant_url
+                playlist = parse_playlist((await self.fetch(stream_url)).decode(errors='replace'), stream_url)
+            if not playlist.segments:
+                CAPTURE_FAILURES.inc(reason='no_frame')
+                return None, "Playlist has no segments"
+            fetched_playlist = time.perf_counter()
+            STAGE_SECONDS.observe(fetched_playlist - started, stage='hls_playlist')
+            
+            init = b''
+            if playlist.init_url:
+                init = self.init_segments.get(playlist.init_url)
+                if init is None:
+                    init = await self.fetch(playlist.init_url)
+                    if len(self.init_segments) >= 32:
+                        self.init_segments.clear()
+                    self.init_segments[playlist.init_url] = init
+            
+            image = await self.fetch_first_frame(playlist.segments[-1].url, init, settings)
+            decoded = time.perf_counter()
+            STAGE_SECONDS.observe(decoded - fetched_playlist, stage='hls_segment_decode')
+            if image is None:
+                CAPTURE_FAILURES.inc(reason='no_frame')
+                return None, "No frame could be decoded from the newest segment"
+            
+            data = await asyncio.to_thread(self.encode, image, settings)
+            finished = time.perf_counter()
+            STAGE_SECONDS.observe(finished - decoded, stage='hls_encode')
+            log_event(logger, 'capture_done', backend='pyav', seconds=finished - started, bytes=len(data))
+            return data, None
+        
+        except asyncio.TimeoutError:
+            CAPTURE_FAILURES.inc(reason='timeout')
+            log_event(logger, 'capture_failed', logging.ERROR, backend='pyav', reason='timeout')
+            return None, "Frame capture timed out"
+        except Exception as e:
+            error = str(e)
+            reason = 'url_rejected' if ' 403 ' in error or ' 404 ' in error else 'error'
+            CAPTURE_FAILURES.inc(reason=reason)
+            log_event(logger, 'capture_failed', logging.ERROR, backend='pyav', reason=reason, error=error)
+            return None, f"Frame capture error: {error}"
+    
+    async def fetch_first_frame(self, segment_url: str, init: bytes, settings: dict):
+        """Download a segment until its first frame decodes, and return it filtered as a PIL image"""
+        buffer = bytearray(init)
+        next_attempt = len(buffer) + self.DECODE_STEP
+        async with self.get_session().get(segment_url) as response:
+            if response.status >= 400:
+                raise RuntimeError(f"HTTP error {response.status} {response.reason}")
+            try:
+                async for chunk in response.content.iter_chunked(65536):
+                    buffer += chunk
+                    if len(buffer) >= next_attempt:
+                        next_attempt = len(buffer) + self.DECODE_STEP
+                        image = await asyncio.to_thread(self.decode_first_frame, bytes(buffer), settings, False)
+                        if image is not None:
+                            return image
+            finally:
+                CAPTURE_BYTES_DOWNLOADED.inc(len(buffer) - len(init), backend='pyav')
+        return await asyncio.to_thread(self.decode_first_frame, bytes(buffer), settings, True)
+    
+    def decode_first_frame(self, data: bytes, settings: dict, complete: bool):
+        """Decode the first keyframe of a segment and apply the profile's filters, or None"""
+        try:
+            with av.open(io.BytesIO(data)) as container:
+                stream = container.streams.video[0]
+                keyframe = None
+                for packet in container.demux(stream):
+                    if keyframe is not None and packet.size:
+                        break  # The keyframe's packet was followed by another, so it is whole
+                    if keyframe is None and packet.is_keyframe and packet.size:
+                        keyframe = packet
+                else:
+                    if not complete:
+                        return None  # The keyframe may be cut off, wait for more of the segment
+                if keyframe is None:
+                    return None
+                
+                frames = stream.decode(keyframe) or stream.decode(None)
+                if not frames:
+                    return None
+                return self.apply_filters(stream, frames[0], settings['vf']).to_image()
+        except (av.FFmpegError, IndexError, ValueError):
+            return None  # Not enough of the segment to open it yet
+    
+    def apply_filters(self, stream, frame, vf: str):
+        """Run an ffmpeg filter chain ("crop=...,scale=...") over one frame"""
+        graph = av.filter.Graph()
+        nodes = [graph.add_buffer(template=stream)]
+        for item in vf.split(','):
+            name, _, args = item.partition('=')
+            nodes.append(graph.add(name, args))
+        nodes.append(graph.add('buffersink'))
+        for source, target in zip(nodes, nodes[1:]):
+            source.link_to(target)
+        graph.configure()
+        graph.push(frame)
+        return graph.pull()
+    
+    def encode(self, image, settings: dict) -> bytes:
+        image_format = PIL_FORMATS.get(settings.get('format', self.config.IMAGE_FORMAT), 'JPEG')
+        options = {}
+        if 'quality' in settings:
+            options['quality'] = settings['quality']
+        elif image_format == 'JPEG':
+            # ffmpeg's -q:v runs from 2 (best) to 31, Pillow's quality from 95 down
+            options['quality'] = max(10, 100 - 3 * settings.get('q:v', 2))
+        output = io.BytesIO()
+        image.convert('RGB').save(output, image_format, **options)
+        return output.getvalue()
+    
+    async def close(self):
+        if self.session:
+            await self.session.close()
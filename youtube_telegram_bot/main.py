@@ -1,7 +1,12 @@
+import time
+
+# Measured before the heavier imports so startup time covers them
+STARTED_AT = time.perf_counter()
+
 import logging
 import os
 from config import Config
-from bot_handler import TelegramBotHandler
+from metrics import start_metrics_server
 
 # Setup logging
 logging.basicConfig(
@@ -20,13 +25,26 @@ def main():
         logger.error("Please set your TELEGRAM_BOT_TOKEN in environment variables or config.py")
         return
     
-    if not config.YOUTUBE_LIVE_URL or 'YOUR_LIVE_STREAM_ID' in config.YOUTUBE_LIVE_URL:
-        logger.error("Please set your YOUTUBE_LIVE_URL in environment variables or config.py")
+    if not config.STREAMS and (not config.YOUTUBE_LIVE_URL or 'YOUR_LIVE_STREAM_ID' in config.YOUTUBE_LIVE_URL):
+        logger.error("Please set your YOUTUBE_LIVE_URL or STREAMS in environment variables or config.py")
         return
     
+    # Without the secret anyone who can reach the port could post updates as any user
+    if config.UPDATE_MODE == 'webhook' and not config.WEBHOOK_SECRET_TOKEN:
+        logger.error("Please set WEBHOOK_SECRET_TOKEN to run in webhook mode")
+        return
+    
+    # Expose capture metrics
+    if config.METRICS_PORT:
+        start_metrics_server(config.METRICS_HOST, config.METRICS_PORT)
+    
     # Create and start bot
     try:
-        bot = TelegramBotHandler(config)
+        # Imported after validation so configuration errors are reported
+        # without loading python-telegram-bot first
+        from bot_handler import TelegramBotHandler
+        
+        bot = TelegramBotHandler(config, started_at=STARTED_AT)
         logger.info("YouTube Live Frame Capture Bot is starting...")
         bot.run()
     except KeyboardInterrupt:
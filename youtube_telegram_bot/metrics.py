@@ -0,0 +1,251 @@
+"""
+Prometheus-style metrics for the YouTube Live Frame Capture Telegram Bot
+"""
+
+import threading
+import logging
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits up to full yt-dlp + ffmpeg runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+def format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = '') -> str:
+    """Render a label set as {name="value",...}"""
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    """Base class holding one value per label combination"""
+    
+    type_name = 'untyped'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+    
+    def label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+    
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    
+    type_name = 'counter'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+    
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f'{self.name}{format_labels(self.labelnames, key)} {value}')
+        return lines
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    
+    type_name = 'gauge'
+    
+    def set(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = value
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+    
+    type_name = 'histogram'
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: (bucket counts, sum, count)
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+    
+    def observe(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            index = bisect_left(self.buckets, value)
+            if index < len(counts):
+                counts[index] += 1
+            self.values[key] = (counts, total + value, count + 1)
+    
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                lines.append(f'{self.name}_sum{format_labels(self.labelnames, key)} {total}')
+                lines.append(f'{self.name}_count{format_labels(self.labelnames, key)} {count}')
+        return lines
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in the text exposition format"""
+    
+    def __init__(self):
+        self.metrics: List[Metric] = []
+    
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'frame_bot_stage_seconds', 'Time spent in each stage of a capture request', ['stage']
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'frame_bot_request_seconds', 'Time from trigger to reply', ['outcome']
+))
+CACHE_HITS = REGISTRY.register(Counter(
+    'frame_bot_cache_hits_total', 'Requests served from a cache', ['cache']
+))
+CACHE_MISSES = REGISTRY.register(Counter(
+    'frame_bot_cache_misses_total', 'Cache lookups that had to do the work', ['cache']
+))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    'frame_bot_coalesced_requests_total', 'Requests that joined a capture already in progress'
+))
+CAPTURE_FAILURES = REGISTRY.register(Counter(
+    'frame_bot_capture_failures_total', 'Failed captures by reason', ['reason']
+))
+UNCHANGED_FRAMES = REGISTRY.register(Counter(
+    'frame_bot_unchanged_frames_total', 'Captured frames that looked the same as the previous one'
+))
+VARIANT_FIRST_FRAME_SECONDS = REGISTRY.register(Gauge(
+    'frame_bot_variant_first_frame_seconds', 'Moving average capture latency per stream variant',
+    ['youtube_url', 'variant']
+))
+VARIANT_FAILURES = REGISTRY.register(Counter(
+    'frame_bot_variant_failures_total', 'Failed captures per stream variant', ['youtube_url', 'variant']
+))
+STREAM_CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    'frame_bot_stream_circuit_open', 'Whether captures of a stream are suspended after repeated failures',
+    ['youtube_url']
+))
+CIRCUIT_OPEN_REQUESTS = REGISTRY.register(Counter(
+    'frame_bot_circuit_open_requests_total', 'Requests answered without a capture because the stream is failing'
+))
+CAPTURE_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'frame_bot_capture_queue_depth', 'Captures waiting for a capture slot by priority class', ['priority']
+))
+CAPTURE_JOBS_DROPPED = REGISTRY.register(Counter(
+    'frame_bot_capture_jobs_dropped_total', 'Capture requests refused (quota, busy) or dropped once served', ['reason']
+))
+CAPTURE_BYTES_DOWNLOADED = REGISTRY.register(Counter(
+    'frame_bot_capture_bytes_downloaded_total', 'Stream bytes fetched by in-process captures', ['backend']
+))
+CAPTURES_IN_FLIGHT = REGISTRY.register(Gauge(
+    'frame_bot_captures_in_flight', 'ffmpeg captures currently running'
+))
+FFMPEG_CHILDREN = REGISTRY.register(Gauge(
+    'frame_bot_ffmpeg_children', 'ffmpeg child processes currently running', ['kind']
+))
+FFMPEG_CHILDREN_KILLED = REGISTRY.register(Counter(
+    'frame_bot_ffmpeg_children_killed_total', 'ffmpeg children killed by the bot or a resource limit', ['kind', 'reason']
+))
+FFMPEG_CHILD_CPU_SECONDS = REGISTRY.register(Counter(
+    'frame_bot_ffmpeg_child_cpu_seconds_total', 'CPU time used by exited ffmpeg children'
+))
+FFMPEG_CHILD_MAX_RSS = REGISTRY.register(Gauge(
+    'frame_bot_ffmpeg_child_max_rss_bytes', 'Largest resident memory of any exited ffmpeg child'
+))
+SEND_RETRIES = REGISTRY.register(Counter(
+    'frame_bot_send_retries_total', 'Telegram calls retried after a flood limit (RetryAfter)'
+))
+WEBHOOK_UPDATES = REGISTRY.register(Counter(
+    'frame_bot_webhook_updates_total', 'Webhook deliveries by result', ['result']
+))
+WEBHOOK_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'frame_bot_webhook_queue_depth', 'Updates waiting for a webhook worker'
+))
+LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    'frame_bot_loop_lag_seconds', 'How late the event loop woke up a sleeping task',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+))
+SLOW_CALLBACKS = REGISTRY.register(Counter(
+    'frame_bot_slow_callbacks_total', 'Times the event loop was blocked longer than LOOP_LAG_THRESHOLD'
+))
+STARTUP_SECONDS = REGISTRY.register(Gauge(
+    'frame_bot_startup_seconds', 'Time from process start until the bot is ready to receive updates'
+))
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves REGISTRY on /metrics"""
+    
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        # Scrapes are frequent, keep them out of the bot log
+        pass
+
+def start_metrics_server(host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    """
+    Start the /metrics HTTP endpoint in a background thread
+    
+    Args:
+        host (str): Interface to bind to
+        port (int): Port to listen on
+    
+    Returns:
+        Optional[ThreadingHTTPServer]: The running server, or None if it could not start
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except OSError as e:
+        logger.error(f"Could not start metrics server on {host}:{port}: {e}")
+        return None
+    
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,161 @@
+"""
+Resource limits and lifecycle of ffmpeg child processes
+"""
+
+import asyncio
+import math
+import os
+import signal
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from config import Config
+from metrics import STAGE_SECONDS, FFMPEG_CHILDREN, FFMPEG_CHILDREN_KILLED, FFMPEG_CHILD_CPU_SECONDS, FFMPEG_CHILD_MAX_RSS
+from utils import log_event
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+def available_cpus() -> int:
+    """CPUs this process may use, honouring affinity and a cgroup v2 CPU quota (container limits)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+class ProcessGovernor:
+    """
+    Spawns every ffmpeg child of the engine: captures, warm readers and clip encodes
+    
+    At most FFMPEG_MAX_PROCESSES children run at once. Each child gets its
+    own process group, an address space limit (FFMPEG_MEMORY_LIMIT_MB), an
+    optional CPU time limit and a lower priority (FFMPEG_NICE), so a burst of
+    captures can't starve the bot itself. Leaving spawn() kills the whole
+    group if the child is still running and reaps it, whether the caller
+    finished, timed out or was cancelled.
+    """
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.cpus = available_cpus()
+        self.max_processes = config.FFMPEG_MAX_PROCESSES or (
+            config.MAX_CONCURRENT_CAPTURES + config.CLIP_ENCODE_WORKERS
+            + (config.MAX_WARM_READERS if config.WARM_READER_ENABLED else 0)
+        )
+        # Threads per ffmpeg, so that a full set of concurrent captures roughly fills the CPUs
+        self.threads = config.FFMPEG_THREADS or max(1, self.cpus // config.MAX_CONCURRENT_CAPTURES)
+        self.slots = asyncio.Semaphore(self.max_processes)
+        self.children: Dict[int, str] = {}
+        self.last_rusage = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+        log_event(
+            logger, 'process_governor_ready', cpus=self.cpus, max_processes=self.max_processes,
+            threads=self.threads, memory_mb=config.FFMPEG_MEMORY_LIMIT_MB, nice=config.FFMPEG_NICE
+        )
+    
+    @asynccontextmanager
+    async def spawn(
+        self,
+        kind: str,
+        cmd: list,
+        cpu_seconds: Optional[float] = None,
+        **kwargs
+    ) -> AsyncIterator[asyncio.subprocess.Process]:
+        """
+        Start a child process once a slot is free and clean it up on exit
+        
+        Args:
+            kind (str): What the child is for ('capture', 'warm_reader', 'clip'), used in logs and metrics
+            cmd (list): Command line
+            cpu_seconds (Optional[float]): CPU time after which the child is killed, None for no limit
+            **kwargs: Passed on to asyncio.create_subprocess_exec()
+        
+        Yields:
+            asyncio.subprocess.Process: The running child
+        """
+        started = time.perf_counter()
+        async with self.slots:
+            slot_acquired = time.perf_counter()
+            STAGE_SECONDS.observe(slot_acquired - started, stage='ffmpeg_slot')
+            process = await asyncio.create_subprocess_exec(*cmd, start_new_session=True, **kwargs)
+            STAGE_SECONDS.observe(time.perf_counter() - slot_acquired, stage='ffmpeg_spawn')
+            self.apply_limits(process.pid, cpu_seconds)
+            self.children[process.pid] = kind
+            FFMPEG_CHILDREN.inc(kind=kind)
+            log_event(logger, 'ffmpeg_started', logging.DEBUG, kind=kind, pid=process.pid, children=len(self.children))
+            killed = False
+            try:
+                yield process
+            finally:
+                try:
+                    killed = await self.kill(process)
+                finally:
+                    del self.children[process.pid]
+                    FFMPEG_CHILDREN.dec(kind=kind)
+                    self.record_exit(kind, process, killed, time.perf_counter() - slot_acquired)
+    
+    def apply_limits(self, pid: int, cpu_seconds: Optional[float]):
+        """Limit a freshly started child's memory, CPU time and priority"""
+        # Set from outside rather than in preexec_fn, which is unsafe in a threaded process
+        try:
+            if resource and hasattr(resource, 'prlimit'):
+                if self.config.FFMPEG_MEMORY_LIMIT_MB:
+                    limit = self.config.FFMPEG_MEMORY_LIMIT_MB * 1024 * 1024
+                    resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+                if cpu_seconds:
+                    # SIGXCPU at the soft limit, SIGKILL at the hard one
+                    soft = math.ceil(cpu_seconds)
+                    resource.prlimit(pid, resource.RLIMIT_CPU, (soft, soft + 5))
+            if self.config.FFMPEG_NICE:
+                os.setpriority(os.PRIO_PROCESS, pid, self.config.FFMPEG_NICE)
+        except (OSError, ValueError) as e:
+            # The child may already have exited, or limits aren't permitted here
+            log_event(logger, 'ffmpeg_limits_failed', logging.DEBUG, pid=pid, error=str(e))
+    
+    async def kill(self, process: Optional[asyncio.subprocess.Process]) -> bool:
+        """Kill a child's process group if it is still running and reap it, returning whether it was killed"""
+        if process is None or process.returncode is not None:
+            return False
+        try:
+            # The child leads its own session, so its group id is its pid
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+        await process.wait()
+        return True
+    
+    def record_exit(self, kind: str, process: asyncio.subprocess.Process, killed: bool, seconds: float):
+        if killed:
+            FFMPEG_CHILDREN_KILLED.inc(kind=kind, reason='killed')
+        elif process.returncode == -signal.SIGXCPU:
+            FFMPEG_CHILDREN_KILLED.inc(kind=kind, reason='cpu_limit')
+        elif process.returncode is not None and process.returncode < 0:
+            FFMPEG_CHILDREN_KILLED.inc(kind=kind, reason='signal')  # e.g. the hard CPU limit or the OOM killer
+        
+        # Resource usage is only reported for reaped children as a whole, the
+        # difference since the last exit covers every child reaped in between
+        if resource:
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu = (usage.ru_utime + usage.ru_stime) - (self.last_rusage.ru_utime + self.last_rusage.ru_stime)
+            self.last_rusage = usage
+            FFMPEG_CHILD_CPU_SECONDS.inc(max(0.0, cpu))
+            FFMPEG_CHILD_MAX_RSS.set(usage.ru_maxrss * 1024)  # Kilobytes on Linux
+        log_event(
+            logger, 'ffmpeg_exited', kind=kind, pid=process.pid, returncode=process.returncode,
+            killed=killed, seconds=seconds, children=len(self.children)
+        )
@@ -0,0 +1,254 @@
+"""
+Rolling buffer of a live HLS stream's newest segments, for cutting short clips
+"""
+
+import asyncio
+import time
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple
+from urllib.parse import urljoin
+import aiohttp
+from config import Config
+from utils import log_event
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PlaylistSegment:
+    sequence: int
+    duration: float
+    url: str
+
+@dataclass
+class MediaPlaylist:
+    segments: List[PlaylistSegment] = field(default_factory=list)
+    target_duration: float = 2.0
+    init_url: Optional[str] = None  # EXT-X-MAP, fMP4 streams only
+    # Lowest-bandwidth variant when the URL pointed to a master playlist
+    variant_url: Optional[str] = None
+
+def parse_playlist(text: str, base_url: str) -> MediaPlaylist:
+    """
+    Parse the parts of an HLS playlist needed to fetch its newest segments
+    
+    Args:
+        text (str): Playlist body
+        base_url (str): URL the playlist was fetched from, for relative URIs
+    
+    Returns:
+        MediaPlaylist: Segments, or variant_url for a master playlist
+    """
+    playlist = MediaPlaylist()
+    sequence = 0
+    duration = None
+    variants = []
+    bandwidth = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            playlist.target_duration = float(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-MAP:'):
+            uri = line.split('URI="', 1)[1].split('"', 1)[0]
+            playlist.init_url = urljoin(base_url, uri)
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',', 1)[0])
+        elif line.startswith('#EXT-X-STREAM-INF:'):
+            attributes = line.split(':', 1)[1]
+            bandwidth = 0
+            for attribute in attributes.split(','):
+                if attribute.startswith('BANDWIDTH='):
+                    bandwidth = int(attribute.split('=', 1)[1])
+        elif not line.startswith('#'):
+            if bandwidth is not None:
+                variants.append((bandwidth, urljoin(base_url, line)))
+                bandwidth = None
+            elif duration is not None:
+                playlist.segments.append(PlaylistSegment(sequence, duration, urljoin(base_url, line)))
+                sequence += 1
+                duration = None
+    if variants:
+        playlist.variant_url = min(variants)[1]
+    return playlist
+
+class SegmentBuffer:
+    """Keeps the last CLIP_BUFFER_SECONDS of a live HLS stream's segments in memory"""
+    
+    def __init__(
+        self,
+        config: Config,
+        youtube_url: str,
+        get_stream_url: Callable[[str], Awaitable[Optional[str]]],
+        invalidate_stream_url: Callable[[str, str], Awaitable[None]]
+    ):
+        self.config = config
+        self.youtube_url = youtube_url
+        self.get_stream_url = get_stream_url
+        self.invalidate_stream_url = invalidate_stream_url
+        
+        # Stream URL resolved on the first refresh and kept until it is rejected.
+        # Resolving on every poll could switch renditions (the variant selector
+        # moves away from failing ones), and segments of different renditions
+        # can't be concatenated into one clip.
+        self.stream_url: Optional[str] = None
+        self.media_url: Optional[str] = None
+        
+        # Downloaded (sequence, duration, bytes), oldest first
+        self.segments: Deque[Tuple[int, float, bytes]] = deque()
+        self.init_url: Optional[str] = None
+        self.init_segment: Optional[bytes] = None
+        self.last_request = time.time()
+        self.task: Optional[asyncio.Task] = None
+        self.filled = asyncio.Event()
+    
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+    
+    @property
+    def buffered_seconds(self) -> float:
+        return sum(duration for _, duration, _ in self.segments)
+    
+    def start(self):
+        """Start polling the playlist if it isn't running"""
+        self.last_request = time.time()
+        if not self.running:
+            logger.info(f"Starting segment buffer for {self.youtube_url}")
+            self.filled.clear()
+            self.task = asyncio.create_task(self.run())
+    
+    def is_idle(self) -> bool:
+        return time.time() - self.last_request > self.config.CLIP_BUFFER_IDLE_TIMEOUT
+    
+    async def run(self):
+        """Fetch new segments every half target duration until the buffer goes idle"""
+        timeout = aiohttp.ClientTimeout(total=self.config.FFMPEG_TIMEOUT)
+        delay = self.config.WARM_READER_BACKOFF
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while not self.is_idle():
+                try:
+                    target_duration = await self.refresh(session)
+                    delay = self.config.WARM_READER_BACKOFF
+                    await asyncio.sleep(max(target_duration / 2, 0.5))
+                except Exception as e:
+                    log_event(logger, 'segment_buffer_failed', logging.WARNING, youtube_url=self.youtube_url, error=str(e))
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.config.WARM_READER_MAX_BACKOFF)
+        
+        logger.info(f"Segment buffer for {self.youtube_url} idle, shutting down")
+        self.segments.clear()
+        self.init_segment = None
+        self.stream_url = self.media_url = self.init_url = None
+    
+    async def fetch(self, session: aiohttp.ClientSession, url: str) -> bytes:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            return await response.read()
+    
+    async def refresh(self, session: aiohttp.ClientSession) -> float:
+        """Download segments added to the playlist since the last refresh"""
+        if self.stream_url is None:
+            self.stream_url = await self.get_stream_url(self.youtube_url)
+            if not self.stream_url:
+                raise RuntimeError("stream URL could not be resolved")
+        url = self.stream_url
+        
+        try:
+            body = await self.fetch(session, url)
+        except aiohttp.ClientResponseError as e:
+            if e.status in (403, 404):
+                # The signed URL expired, resolve the stream again on the next refresh
+                await self.invalidate_stream_url(self.youtube_url, url)
+                self.stream_url = None
+            raise
+        
+        playlist = parse_playlist(body.decode(errors='replace'), url)
+        if playlist.variant_url:
+            url = playlist.variant_url
+            playlist = parse_playlist((await self.fetch(session, url)).decode(errors='replace'), url)
+        
+        if url != self.media_url:
+            if self.media_url is not None:
+                # Re-resolved to another playlist, don't mix its segments with the buffered ones
+                log_event(logger, 'segment_buffer_reset', youtube_url=self.youtube_url, dropped=len(self.segments))
+                self.segments.clear()
+                self.init_url = self.init_segment = None
+            self.media_url = url
+        
+        if playlist.init_url and playlist.init_url != self.init_url:
+            self.init_segment = await self.fetch(session, playlist.init_url)
+            self.init_url = playlist.init_url
+        
+        if not playlist.segments:
+            raise RuntimeError("playlist has no segments")
+        
+        if self.segments and playlist.segments[-1].sequence < self.segments[-1][0]:
+            # Sequence numbers went back, the stream restarted
+            self.segments.clear()
+        last_sequence = self.segments[-1][0] if self.segments else -1
+        new = [s for s in playlist.segments if s.sequence > last_sequence]
+        
+        # On the first fill only the tail the buffer keeps is worth downloading
+        kept, total = [], 0.0
+        for segment in reversed(new):
+            if total >= self.config.CLIP_BUFFER_SECONDS:
+                break
+            kept.insert(0, segment)
+            total += segment.duration
+        
+        started = time.perf_counter()
+        bodies = await asyncio.gather(*(self.fetch(session, s.url) for s in kept))
+        for segment, body in zip(kept, bodies):
+            self.segments.append((segment.sequence, segment.duration, body))
+        while self.segments and self.buffered_seconds - self.segments[0][1] >= self.config.CLIP_BUFFER_SECONDS:
+            self.segments.popleft()
+        
+        if kept:
+            log_event(
+                logger, 'segments_fetched', logging.DEBUG, youtube_url=self.youtube_url,
+                count=len(kept), seconds=time.perf_counter() - started
+            )
+        if self.segments:
+            self.filled.set()
+        return playlist.target_duration
+    
+    async def get_recent(self, seconds: float) -> Optional[Tuple[bytes, float]]:
+        """
+        Return the newest segments covering at least seconds of the stream
+        
+        Args:
+            seconds (float): Clip length wanted
+        
+        Returns:
+            Optional[Tuple[bytes, float]]: Concatenated segments (with the init
+            segment for fMP4) and the offset at which the last seconds start,
+            or None if nothing could be buffered in time
+        """
+        self.start()
+        try:
+            await asyncio.wait_for(self.filled.wait(), timeout=self.config.FFMPEG_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None
+        
+        chosen, total = [], 0.0
+        for _, duration, body in reversed(self.segments):
+            chosen.insert(0, body)
+            total += duration
+            if total >= seconds:
+                break
+        if not chosen:
+            return None
+        
+        data = b''.join(([self.init_segment] if self.init_segment else []) + chosen)
+        return data, max(0.0, total - seconds)
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
@@ -0,0 +1,122 @@
+"""
+Outbound Telegram calls paced to stay under the Bot API flood limits
+"""
+
+import asyncio
+import time
+import logging
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict
+from telegram.error import RetryAfter
+from config import Config
+from metrics import STAGE_SECONDS, SEND_RETRIES
+from utils import log_event
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Token bucket where callers reserve a token and wait until it is theirs"""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before using it"""
+        self.refill()
+        self.tokens -= 1
+        # A negative balance queues callers behind each other in arrival order
+        return max(0.0, -self.tokens / self.rate)
+    
+    def try_take(self) -> float:
+        """Take a token if one is available, otherwise return how long until one is"""
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next seconds (after a RetryAfter from Telegram)"""
+        self.refill()
+        # The next reservation then lands exactly seconds from now
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+    
+    def is_full(self) -> bool:
+        self.refill()
+        return self.tokens >= self.capacity
+
+class TelegramSender:
+    """Paces Telegram API calls per chat and globally and retries flood-limited calls"""
+    
+    # Drop idle per-chat buckets once this many chats have been seen
+    MAX_IDLE_BUCKETS = 1000
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.global_bucket = TokenBucket(config.TELEGRAM_GLOBAL_RATE, config.TELEGRAM_GLOBAL_RATE)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+    
+    def get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= self.MAX_IDLE_BUCKETS:
+                self.chat_buckets = {
+                    key: value for key, value in self.chat_buckets.items() if not value.is_full()
+                }
+            # Negative chat ids are groups and channels, which have a lower limit
+            rate = self.config.TELEGRAM_GROUP_RATE if chat_id < 0 else self.config.TELEGRAM_CHAT_RATE
+            bucket = TokenBucket(rate, self.config.TELEGRAM_CHAT_BURST)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+    
+    async def throttle(self, chat_id: int):
+        """Wait until both the chat and the global limit allow another call"""
+        delay = self.get_chat_bucket(chat_id).reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        # Global token is taken last so a busy chat doesn't hold one while it waits
+        delay = self.global_bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+    
+    async def call(self, chat_id: int, method: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Call a Bot API method for a chat, pacing it and retrying after flood errors
+        
+        Args:
+            chat_id (int): Chat the call sends to, used for the per-chat limit
+            method (Callable): Bound coroutine method, e.g. message.reply_photo
+        
+        Returns:
+            Any: Whatever the method returns
+        """
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            await self.throttle(chat_id)
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='send_throttle')
+            try:
+                return await method(*args, **kwargs)
+            except RetryAfter as e:
+                attempt += 1
+                if attempt > self.config.SEND_MAX_RETRIES:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                SEND_RETRIES.inc()
+                log_event(
+                    logger, 'send_flood_limited', logging.WARNING,
+                    chat_id=chat_id, retry_after=retry_after, attempt=attempt
+                )
+                # The limit may be per chat or bot-wide, so hold back both
+                self.get_chat_bucket(chat_id).pause(retry_after)
+                self.global_bucket.pause(retry_after)
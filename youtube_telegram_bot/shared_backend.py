@@ -0,0 +1,208 @@
+"""
+Shared state for running several bot replicas against the same streams
+
+Replicas share the latest frame per stream (with its Telegram file_id) and
+resolved stream URLs, and use a lease so only one of them captures a given
+stream at a time.
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SharedFrame:
+    data: bytes
+    captured_at: float
+    file_id: Optional[str] = None
+
+class SharedBackend(ABC):
+    """Interface implemented by every shared state backend"""
+    
+    @abstractmethod
+    def get_frame(self, key: str) -> Optional[SharedFrame]:
+        pass
+    
+    @abstractmethod
+    def put_frame(self, key: str, data: bytes, captured_at: float):
+        pass
+    
+    @abstractmethod
+    def set_file_id(self, key: str, captured_at: float, file_id: str):
+        """Attach a file_id to the stored frame if it is still the one captured at captured_at"""
+    
+    @abstractmethod
+    def get_stream_url(self, key: str) -> Optional[Tuple[str, float]]:
+        """Return (stream_url, expires_at) if known"""
+    
+    @abstractmethod
+    def put_stream_url(self, key: str, stream_url: str, expires_at: float):
+        pass
+    
+    @abstractmethod
+    def delete_stream_url(self, key: str, stream_url: str):
+        """Forget a stream URL that was rejected, unless it was already replaced"""
+    
+    @abstractmethod
+    def try_acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """Take or extend the capture lease for a stream; False if another owner holds it"""
+    
+    @abstractmethod
+    def release_lease(self, key: str, owner: str):
+        pass
+    
+    def close(self):
+        pass
+
+class InProcessBackend(SharedBackend):
+    """Dictionary backed stand-in, shared by engines within one process"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames: Dict[str, SharedFrame] = {}
+        self.stream_urls: Dict[str, Tuple[str, float]] = {}
+        self.leases: Dict[str, Tuple[str, float]] = {}
+    
+    def get_frame(self, key: str) -> Optional[SharedFrame]:
+        with self.lock:
+            return self.frames.get(key)
+    
+    def put_frame(self, key: str, data: bytes, captured_at: float):
+        with self.lock:
+            self.frames[key] = SharedFrame(data, captured_at)
+    
+    def set_file_id(self, key: str, captured_at: float, file_id: str):
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame and frame.captured_at == captured_at:
+                frame.file_id = file_id
+    
+    def get_stream_url(self, key: str) -> Optional[Tuple[str, float]]:
+        with self.lock:
+            return self.stream_urls.get(key)
+    
+    def put_stream_url(self, key: str, stream_url: str, expires_at: float):
+        with self.lock:
+            self.stream_urls[key] = (stream_url, expires_at)
+    
+    def delete_stream_url(self, key: str, stream_url: str):
+        with self.lock:
+            cached = self.stream_urls.get(key)
+            if cached and cached[0] == stream_url:
+                del self.stream_urls[key]
+    
+    def try_acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self.lock:
+            holder = self.leases.get(key)
+            if holder and holder[0] != owner and holder[1] > now:
+                return False
+            self.leases[key] = (owner, now + ttl)
+            return True
+    
+    def release_lease(self, key: str, owner: str):
+        with self.lock:
+            holder = self.leases.get(key)
+            if holder and holder[0] == owner:
+                del self.leases[key]
+
+class SQLiteBackend(SharedBackend):
+    """SQLite file backend for replicas on one host or sharing a volume"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS frames (
+                key TEXT PRIMARY KEY, data BLOB NOT NULL, captured_at REAL NOT NULL, file_id TEXT
+            );
+            CREATE TABLE IF NOT EXISTS stream_urls (
+                key TEXT PRIMARY KEY, stream_url TEXT NOT NULL, expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL
+            );
+        ''')
+    
+    def execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self.lock:
+            return self.db.execute(sql, params)
+    
+    def get_frame(self, key: str) -> Optional[SharedFrame]:
+        row = self.execute(
+            'SELECT data, captured_at, file_id FROM frames WHERE key = ?', (key,)
+        ).fetchone()
+        return SharedFrame(bytes(row[0]), row[1], row[2]) if row else None
+    
+    def put_frame(self, key: str, data: bytes, captured_at: float):
+        self.execute(
+            'INSERT OR REPLACE INTO frames (key, data, captured_at, file_id) VALUES (?, ?, ?, NULL)',
+            (key, data, captured_at)
+        )
+    
+    def set_file_id(self, key: str, captured_at: float, file_id: str):
+        self.execute(
+            'UPDATE frames SET file_id = ? WHERE key = ? AND captured_at = ?',
+            (file_id, key, captured_at)
+        )
+    
+    def get_stream_url(self, key: str) -> Optional[Tuple[str, float]]:
+        row = self.execute(
+            'SELECT stream_url, expires_at FROM stream_urls WHERE key = ?', (key,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+    
+    def put_stream_url(self, key: str, stream_url: str, expires_at: float):
+        self.execute(
+            'INSERT OR REPLACE INTO stream_urls (key, stream_url, expires_at) VALUES (?, ?, ?)',
+            (key, stream_url, expires_at)
+        )
+    
+    def delete_stream_url(self, key: str, stream_url: str):
+        self.execute('DELETE FROM stream_urls WHERE key = ? AND stream_url = ?', (key, stream_url))
+    
+    def try_acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        # Insert, or take over a lease that is ours already or has expired
+        cursor = self.execute(
+            '''INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)
+               ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+               WHERE leases.owner = excluded.owner OR leases.expires_at < ?''',
+            (key, owner, now + ttl, now)
+        )
+        return cursor.rowcount > 0
+    
+    def release_lease(self, key: str, owner: str):
+        self.execute('DELETE FROM leases WHERE key = ? AND owner = ?', (key, owner))
+    
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def create_shared_backend(config: Config) -> Optional[SharedBackend]:
+    """
+    Create the backend selected by SHARED_BACKEND
+    
+    Args:
+        config (Config): Bot configuration
+    
+    Returns:
+        Optional[SharedBackend]: Backend instance, or None when sharing is disabled
+    """
+    if config.SHARED_BACKEND == 'memory':
+        return InProcessBackend()
+    if config.SHARED_BACKEND == 'sqlite':
+        return SQLiteBackend(config.SHARED_BACKEND_PATH)
+    if config.SHARED_BACKEND:
+        logger.warning(f"Unknown SHARED_BACKEND '{config.SHARED_BACKEND}', replicas will not share state")
+    return None
@@ -0,0 +1,127 @@
+"""
+Per-stream health tracking with a circuit breaker for offline or failing streams
+"""
+
+import asyncio
+import time
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+from config import Config
+from metrics import STREAM_CIRCUIT_OPEN
+from utils import log_event
+
+logger = logging.getLogger(__name__)
+
+# Circuit states
+CLOSED = 'closed'  # Captures run normally
+OPEN = 'open'  # Captures are refused until the next probe
+HALF_OPEN = 'half_open'  # A probe capture is checking whether the stream recovered
+
+@dataclass
+class StreamHealth:
+    youtube_url: str
+    state: str = CLOSED
+    consecutive_failures: int = 0
+    last_success_at: Optional[float] = None
+    last_failure_at: Optional[float] = None
+    last_error: Optional[str] = None
+    average_latency: Optional[float] = None  # Seconds per successful capture, moving average
+    probe_delay: float = 0.0
+    next_probe_at: Optional[float] = None
+
+class StreamHealthTracker:
+    """
+    Circuit breaker per stream
+    
+    After CIRCUIT_FAILURE_THRESHOLD failed captures in a row the circuit opens
+    and triggers are answered at once instead of waiting out the resolve and
+    ffmpeg timeouts. A background probe then retries the stream with
+    exponential back-off and closes the circuit on its first success.
+    """
+    
+    # Weight of the newest sample in the latency moving average
+    LATENCY_ALPHA = 0.3
+    
+    def __init__(self, config: Config, probe: Callable[[str], Awaitable[object]]):
+        self.config = config
+        # Runs a capture of the stream, whose outcome is reported back through record_*
+        self.probe = probe
+        self.streams: Dict[str, StreamHealth] = {}
+        self.probe_tasks: Dict[str, asyncio.Task] = {}
+    
+    def get(self, youtube_url: str) -> StreamHealth:
+        health = self.streams.get(youtube_url)
+        if health is None:
+            health = StreamHealth(youtube_url)
+            self.streams[youtube_url] = health
+        return health
+    
+    def allow_capture(self, youtube_url: str) -> bool:
+        """False while the stream's circuit is open or a probe is running"""
+        health = self.streams.get(youtube_url)
+        return health is None or health.state == CLOSED
+    
+    def record_success(self, youtube_url: str, seconds: float):
+        health = self.get(youtube_url)
+        if health.state != CLOSED:
+            log_event(logger, 'circuit_closed', youtube_url=youtube_url, failures=health.consecutive_failures)
+        health.state = CLOSED
+        health.consecutive_failures = 0
+        health.last_success_at = time.time()
+        health.next_probe_at = None
+        if health.average_latency is None:
+            health.average_latency = seconds
+        else:
+            health.average_latency = self.LATENCY_ALPHA * seconds + (1 - self.LATENCY_ALPHA) * health.average_latency
+        STREAM_CIRCUIT_OPEN.set(0, youtube_url=youtube_url)
+    
+    def record_failure(self, youtube_url: str, error: Optional[str]):
+        health = self.get(youtube_url)
+        health.consecutive_failures += 1
+        health.last_failure_at = time.time()
+        health.last_error = error
+        
+        if health.state == HALF_OPEN:
+            # The probe failed, wait twice as long before the next one
+            delay = min(health.probe_delay * 2, self.config.CIRCUIT_MAX_PROBE_INTERVAL)
+            self.open_circuit(health, delay)
+        elif health.state == CLOSED and health.consecutive_failures >= self.config.CIRCUIT_FAILURE_THRESHOLD:
+            self.open_circuit(health, self.config.CIRCUIT_PROBE_INTERVAL)
+    
+    def open_circuit(self, health: StreamHealth, delay: float):
+        health.state = OPEN
+        health.probe_delay = delay
+        health.next_probe_at = time.time() + delay
+        STREAM_CIRCUIT_OPEN.set(1, youtube_url=health.youtube_url)
+        log_event(
+            logger, 'circuit_opened', logging.WARNING, youtube_url=health.youtube_url,
+            failures=health.consecutive_failures, next_probe=delay, error=health.last_error
+        )
+        
+        task = self.probe_tasks.get(health.youtube_url)
+        if task is None or task.done():
+            self.probe_tasks[health.youtube_url] = asyncio.create_task(self.run_probes(health))
+    
+    async def run_probes(self, health: StreamHealth):
+        """Probe the stream on its back-off schedule until a capture succeeds"""
+        while health.state != CLOSED:
+            await asyncio.sleep(max(0.0, health.next_probe_at - time.time()))
+            if health.state == CLOSED:
+                break  # A capture that was already running succeeded
+            health.state = HALF_OPEN
+            log_event(logger, 'circuit_probe', youtube_url=health.youtube_url)
+            try:
+                await self.probe(health.youtube_url)
+            except Exception as e:
+                self.record_failure(health.youtube_url, str(e))
+            if health.state == HALF_OPEN:
+                # The probe returned without reporting, don't spin on it
+                self.record_failure(health.youtube_url, health.last_error)
+    
+    async def stop(self):
+        tasks = list(self.probe_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.probe_tasks.clear()
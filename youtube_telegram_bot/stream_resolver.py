@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+import logging
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+from config import Config
+from utils import log_event
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StreamVariant:
+    """One rendition of a live stream as listed by yt-dlp"""
+    url: str
+    format_id: str = 'default'
+    height: Optional[int] = None
+    tbr: Optional[float] = None  # Total bitrate in kbit/s
+    
+    @property
+    def label(self) -> str:
+        return f"{self.height}p-{self.format_id}" if self.height else self.format_id
+
+def variants_to_json(variants: List[StreamVariant]) -> str:
+    return json.dumps([asdict(v) for v in variants])
+
+def variants_from_json(text: str) -> List[StreamVariant]:
+    return [StreamVariant(**item) for item in json.loads(text)]
+
+def extract_variants(info: dict) -> List[StreamVariant]:
+    """
+    List the video variants of a yt-dlp info dict, preferring HLS renditions
+    
+    Args:
+        info (dict): Result of YoutubeDL.extract_info
+        
+    Returns:
+        List[StreamVariant]: Video variants, or the single selected URL if formats are missing
+    """
+    video = [
+        f for f in info.get('formats') or []
+        if f.get('url') and f.get('vcodec') != 'none'
+    ]
+    # Live streams list both HLS and DASH renditions, ffmpeg starts faster on HLS
+    hls = [f for f in video if str(f.get('protocol', '')).startswith('m3u8')]
+    variants = [
+        StreamVariant(
+            url=f['url'],
+            format_id=str(f.get('format_id', 'default')),
+            height=f.get('height'),
+            tbr=f.get('tbr')
+        )
+        for f in hls or video
+    ]
+    if not variants and info.get('url'):
+        variants = [StreamVariant(url=info['url'], height=info.get('height'), tbr=info.get('tbr'))]
+    return variants
+
+class StreamResolver:
+    """Long-lived yt-dlp resolver keeping one YoutubeDL instance per worker thread"""
+    
+    def __init__(self, config: Config):
+        self.config = config
+        # YoutubeDL is not thread-safe, so each resolver thread gets its own
+        # instance and keeps reusing it (and its HTTP connections)
+        self.local = threading.local()
+        self.instances: List = []
+        self.lock = threading.Lock()
+    
+    def get_ydl(self):
+        """Return this thread's YoutubeDL instance, creating it on first use"""
+        ydl = getattr(self.local, 'ydl', None)
+        if ydl is None:
+            # Imported lazily, yt-dlp adds noticeably to cold start
+            import yt_dlp
+            
+            ydl_opts = {
+                'quiet': True,
+                'no_warnings': True,
+                'extract_flat': False,
+                'format': 'best[ext=mp4]/best',
+                'socket_timeout': self.config.YTDLP_TIMEOUT,
+            }
+            ydl = yt_dlp.YoutubeDL(ydl_opts)
+            self.local.ydl = ydl
+            with self.lock:
+                self.instances.append(ydl)
+        return ydl
+    
+    def warm_up(self):
+        """Import yt-dlp and initialise its extractors ahead of the first request"""
+        started = time.perf_counter()
+        self.get_ydl()
+        log_event(logger, 'resolver_ready', seconds=time.perf_counter() - started)
+    
+    def resolve(self, youtube_url: str) -> Optional[List[StreamVariant]]:
+        """Extract the stream's variants using yt-dlp"""
+        try:
+            info = self.get_ydl().extract_info(youtube_url, download=False)
+            variants = extract_variants(info) if info else []
+            if variants:
+                return variants
+            else:
+                log_event(logger, 'resolve_failed', logging.ERROR, reason='no stream URL found')
+                return None
+        except Exception as e:
+            log_event(logger, 'resolve_failed', logging.ERROR, reason=f"yt-dlp error: {e}")
+            return None
+    
+    def close(self):
+        """Close every YoutubeDL instance and its HTTP sessions"""
+        with self.lock:
+            instances, self.instances = self.instances, []
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception as e:
+                log_event(logger, 'resolver_close_failed', logging.WARNING, error=str(e))
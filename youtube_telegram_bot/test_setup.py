@@ -25,6 +25,21 @@ def test_imports():
         print(f"❌ Failed to import yt-dlp: {e}")
         return False
     
+    try:
+        import aiohttp
+        print("✅ aiohttp imported successfully")
+    except ImportError as e:
+        print(f"❌ Failed to import aiohttp: {e}")
+        return False
+    
+    try:
+        import numpy
+        import PIL
+        print("✅ numpy and Pillow imported successfully")
+    except ImportError as e:
+        print(f"❌ Failed to import numpy/Pillow: {e}")
+        return False
+    
     return True
 
 def test_local_modules():
@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+from config import Config
+from capture_scheduler import ADMIN, SUBSCRIPTION, TRIGGER, CaptureScheduler, CaptureWithdrawn
+
+ADMIN_ID = 1
+
+@pytest.fixture
+def scheduler():
+    config = Config()
+    config.MAX_CONCURRENT_CAPTURES = 1
+    config.CAPTURE_QUEUE_LIMIT = 2
+    config.ADMIN_USER_IDS = [ADMIN_ID]
+    config.USER_CAPTURE_BURST = 3
+    return CaptureScheduler(config)
+
+def test_slots_go_to_the_best_priority_then_the_oldest(scheduler):
+    async def run():
+        served = []
+        
+        async def capture(key: str, priority: int):
+            await scheduler.acquire(key, priority)
+            served.append(key)
+        
+        await scheduler.acquire('running', TRIGGER)
+        waiting = []
+        for key, priority in [('trigger-1', TRIGGER), ('subscription', SUBSCRIPTION),
+                              ('trigger-2', TRIGGER), ('admin', ADMIN)]:
+            waiting.append(asyncio.create_task(capture(key, priority)))
+            await asyncio.sleep(0)
+        for _ in waiting:
+            scheduler.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*waiting)
+        return served
+    
+    assert asyncio.run(run()) == ['admin', 'subscription', 'trigger-1', 'trigger-2']
+
+def test_joining_request_raises_a_queued_capture(scheduler):
+    async def run():
+        await scheduler.acquire('running', TRIGGER)
+        served = []
+        
+        async def capture(key: str, priority: int):
+            await scheduler.acquire(key, priority)
+            served.append(key)
+        
+        first = asyncio.create_task(capture('first', TRIGGER))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(capture('second', TRIGGER))
+        await asyncio.sleep(0)
+        scheduler.raise_priority('second', ADMIN)
+        scheduler.release()
+        await second
+        scheduler.release()
+        await first
+        return served
+    
+    assert asyncio.run(run()) == ['second', 'first']
+
+def test_withdrawn_capture_gives_up_its_place(scheduler):
+    async def run():
+        await scheduler.acquire('running', TRIGGER)
+        waiting = asyncio.create_task(scheduler.acquire('stale', TRIGGER))
+        await asyncio.sleep(0)
+        scheduler.withdraw('stale')
+        with pytest.raises(CaptureWithdrawn):
+            await waiting
+        scheduler.release()
+        # Nobody else is waiting, so the slot is free again
+        await asyncio.wait_for(scheduler.acquire('next', TRIGGER), timeout=1)
+    
+    asyncio.run(run())
+
+def test_triggers_are_busy_once_the_queue_is_full(scheduler):
+    async def run():
+        await scheduler.acquire('running', TRIGGER)
+        assert not scheduler.is_busy(TRIGGER)
+        waiting = [asyncio.create_task(scheduler.acquire(key, TRIGGER)) for key in ('a', 'b')]
+        await asyncio.sleep(0)
+        busy = scheduler.is_busy(TRIGGER), scheduler.is_busy(ADMIN)
+        for task in waiting:
+            task.cancel()
+        await asyncio.gather(*waiting, return_exceptions=True)
+        return busy
+    
+    assert asyncio.run(run()) == (True, False)
+
+def test_quota_limits_users_but_not_admins(scheduler):
+    assert [scheduler.check_quota(42) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert scheduler.check_quota(42) > 0
+    assert scheduler.check_quota(43) == 0.0
+    assert all(scheduler.check_quota(ADMIN_ID) == 0.0 for _ in range(10))
+    assert scheduler.priority_for(ADMIN_ID) == ADMIN
+    assert scheduler.priority_for(42) == TRIGGER
@@ -0,0 +1,51 @@
+import io
+import itertools
+import pytest
+from PIL import Image, ImageDraw
+from config import Config
+from frame_capture import FrameCaptureEngine
+
+CLOCK = itertools.count(1.0)
+
+def make_frame(offset: int) -> bytes:
+    """A white bar on black, moved right by offset pixels"""
+    image = Image.new('RGB', (1280, 720))
+    ImageDraw.Draw(image).rectangle((200 + offset, 200, 600 + offset, 520), fill='white')
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+@pytest.fixture
+def engine():
+    config = Config()
+    config.FRAME_HISTORY_ENABLED = False
+    config.SHARED_BACKEND = ''
+    return FrameCaptureEngine(config)
+
+def store(engine: FrameCaptureEngine, offset: int, uploads: list):
+    """Store a frame as a capture would, uploading it unless it can reuse a file_id"""
+    data = make_frame(offset)
+    frame = engine.store_frame('url', 'full', data, next(CLOCK), engine.differ.signature(data))
+    if frame.file_id is None:
+        uploads.append(offset)
+        frame.file_id = f'upload-{len(uploads)}'
+    return frame
+
+def test_unchanged_frame_reuses_file_id(engine):
+    uploads = []
+    first = store(engine, 0, uploads)
+    second = store(engine, 0, uploads)
+    assert second.changed is False
+    assert second.file_id == first.file_id
+    assert uploads == [0]
+
+def test_gradual_drift_is_detected(engine):
+    # Each 1px step is below the threshold, but the drift since the last upload is not
+    uploads = []
+    for offset in range(120):
+        frame = store(engine, offset, uploads)
+    assert len(uploads) > 1
+    assert frame.file_id == f'upload-{len(uploads)}'
+    # The frame that was sent never differs from the current one by more than the threshold
+    uploaded = engine.differ.signature(make_frame(uploads[-1]))
+    assert not engine.differ.has_changed(uploaded, frame.signature)
@@ -0,0 +1,38 @@
+import time
+import pytest
+from config import Config
+from frame_history import FrameHistory
+
+URL = 'https://www.youtube.com/watch?v=test'
+# Frames older than FRAME_HISTORY_MAX_AGE are evicted, so the tests use recent times
+START = time.time() - 24 * 3600
+
+@pytest.fixture
+def history(tmp_path):
+    config = Config()
+    config.FRAME_HISTORY_PATH = str(tmp_path / 'frame_history.db')
+    config.FRAME_HISTORY_MAX_GAP = 900
+    history = FrameHistory(config)
+    yield history
+    history.close()
+
+def test_look_back_returns_the_frame_shown_at_that_time(history):
+    history.add(URL, 'full', b'first', START + 1000.0)
+    history.add(URL, 'full', b'second', START + 2000.0)
+    # Closer to the second frame, but the first one was still on screen
+    assert history.nearest(URL, START + 1900.0).data == b'first'
+    assert history.nearest(URL, START + 2000.0).data == b'second'
+
+def test_look_back_after_a_quiet_period_finds_the_last_stored_frame(history):
+    # Unchanged frames aren't stored, so hours can pass without a new row
+    history.add(URL, 'full', b'still', START + 1000.0)
+    assert history.nearest(URL, START + 1000.0 + 6 * 3600).data == b'still'
+
+def test_look_back_before_the_first_frame_uses_it_only_when_close(history):
+    history.add(URL, 'full', b'first', START + 10000.0)
+    assert history.nearest(URL, START + 9500.0).data == b'first'
+    assert history.nearest(URL, START + 9000.0) is None
+
+def test_look_back_only_sees_its_own_stream(history):
+    history.add('https://www.youtube.com/watch?v=other', 'full', b'other', START + 1000.0)
+    assert history.nearest(URL, START + 1000.0) is None
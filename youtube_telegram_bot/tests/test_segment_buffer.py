@@ -0,0 +1,44 @@
+from segment_buffer import parse_playlist
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720,CODECS="avc1.4d401f,mp4a.40.2"
+720p/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,CODECS="avc1.4d401e,mp4a.40.2"
+360p/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080
+https://cdn.example.com/1080p/index.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-TARGETDURATION:4
+#EXT-X-MEDIA-SEQUENCE:120
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:4.000,
+seg120.m4s
+#EXTINF:3.960,
+seg121.m4s
+
+#EXTINF:4.000,
+https://cdn.example.com/live/seg122.m4s
+"""
+
+def test_master_playlist_selects_the_lowest_bandwidth_variant():
+    playlist = parse_playlist(MASTER, 'https://example.com/live/master.m3u8')
+    assert playlist.variant_url == 'https://example.com/live/360p/index.m3u8'
+    assert playlist.segments == []
+
+def test_media_playlist_lists_its_segments():
+    playlist = parse_playlist(MEDIA, 'https://example.com/live/360p/index.m3u8')
+    assert playlist.variant_url is None
+    assert playlist.target_duration == 4.0
+    assert playlist.init_url == 'https://example.com/live/360p/init.mp4'
+    assert [(s.sequence, s.duration) for s in playlist.segments] == [(120, 4.0), (121, 3.96), (122, 4.0)]
+    assert playlist.segments[0].url == 'https://example.com/live/360p/seg120.m4s'
+    assert playlist.segments[2].url == 'https://cdn.example.com/live/seg122.m4s'
+
+def test_mpegts_playlist_has_no_init_segment():
+    text = "#EXTM3U\n#EXT-X-TARGETDURATION:2\n#EXTINF:2.0,\nseg0.ts\n"
+    playlist = parse_playlist(text, 'https://example.com/live.m3u8')
+    assert playlist.init_url is None
+    assert [(s.sequence, s.url) for s in playlist.segments] == [(0, 'https://example.com/seg0.ts')]
@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+import pytest
+import send_queue
+from send_queue import TokenBucket
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the buckets' monotonic clock with one the test advances"""
+    now = [1000.0]
+    monkeypatch.setattr(send_queue, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+def test_reserve_spends_the_burst_then_queues_callers(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    # Two tokens are available at once, then one every half second in arrival order
+    assert waits == [0.0, 0.0, 0.5, 1.0]
+
+def test_try_take_refuses_until_a_token_refills(clock):
+    bucket = TokenBucket(rate=0.1, capacity=3)
+    assert [bucket.try_take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_take() == pytest.approx(10.0)
+    clock[0] += 4
+    assert bucket.try_take() == pytest.approx(6.0)
+    clock[0] += 6
+    assert bucket.try_take() == 0.0
+
+def test_refill_stops_at_capacity(clock):
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.reserve()
+    clock[0] += 60
+    assert bucket.is_full()
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 1.0]
+
+def test_pause_delays_the_next_reservation(clock):
+    bucket = TokenBucket(rate=1, capacity=5)
+    bucket.pause(7)
+    assert bucket.reserve() == pytest.approx(7.0)
@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from config import Config
+from stream_health import CLOSED, OPEN, StreamHealthTracker
+
+URL = 'https://www.youtube.com/watch?v=test'
+
+@pytest.fixture
+def config():
+    config = Config()
+    config.CIRCUIT_FAILURE_THRESHOLD = 3
+    config.CIRCUIT_PROBE_INTERVAL = 0.01
+    config.CIRCUIT_MAX_PROBE_INTERVAL = 0.03
+    return config
+
+def test_circuit_opens_after_consecutive_failures(config):
+    async def run():
+        tracker = StreamHealthTracker(config, probe=asyncio.Event().wait)
+        for _ in range(config.CIRCUIT_FAILURE_THRESHOLD - 1):
+            tracker.record_failure(URL, 'offline')
+        assert tracker.allow_capture(URL)
+        tracker.record_failure(URL, 'offline')
+        health = tracker.get(URL)
+        state = health.state, tracker.allow_capture(URL), health.last_error
+        await tracker.stop()
+        return state
+    
+    assert asyncio.run(run()) == (OPEN, False, 'offline')
+
+def test_success_resets_the_failure_count(config):
+    async def run():
+        tracker = StreamHealthTracker(config, probe=asyncio.Event().wait)
+        tracker.record_failure(URL, 'offline')
+        tracker.record_failure(URL, 'offline')
+        tracker.record_success(URL, 1.0)
+        tracker.record_failure(URL, 'offline')
+        await tracker.stop()
+        return tracker.get(URL).state, tracker.get(URL).consecutive_failures
+    
+    assert asyncio.run(run()) == (CLOSED, 1)
+
+def test_probe_backs_off_then_closes_the_circuit(config):
+    async def run():
+        probes = []
+        
+        async def probe(youtube_url: str):
+            probes.append(tracker.get(youtube_url).probe_delay)
+            if len(probes) < 3:
+                tracker.record_failure(youtube_url, 'still offline')
+            else:
+                tracker.record_success(youtube_url, 1.0)
+        
+        tracker = StreamHealthTracker(config, probe)
+        for _ in range(config.CIRCUIT_FAILURE_THRESHOLD):
+            tracker.record_failure(URL, 'offline')
+        await asyncio.wait_for(tracker.probe_tasks[URL], timeout=5)
+        return probes, tracker.get(URL).state, tracker.allow_capture(URL), tracker.get(URL).consecutive_failures
+    
+    probes, state, allowed, failures = asyncio.run(run())
+    # The delay doubles after each failed probe, up to CIRCUIT_MAX_PROBE_INTERVAL
+    assert probes == pytest.approx([0.01, 0.02, 0.03])
+    assert (state, allowed, failures) == (CLOSED, True, 0)
@@ -3,18 +3,56 @@ Utility functions for the YouTube Live Frame Capture Telegram Bot
 """
 
 import os
+import re
+import uuid
 import logging
-from typing import List
+import contextvars
+from datetime import datetime, timedelta
+from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
+# Correlation id of the request being handled, inherited by tasks it starts
+request_id_var: contextvars.ContextVar = contextvars.ContextVar('request_id', default='-')
+
+def new_request_id() -> str:
+    """
+    Start a new correlation id for the current request
+    
+    Returns:
+        str: Short random id, also set as the current request id
+    """
+    request_id = uuid.uuid4().hex[:8]
+    request_id_var.set(request_id)
+    return request_id
+
+def log_event(log: logging.Logger, event: str, level: int = logging.INFO, **fields) -> None:
+    """
+    Log a structured key=value line tagged with the current request id
+    
+    Args:
+        log (logging.Logger): Logger to write to
+        event (str): Short event name, e.g. "capture_done"
+        level (int): Logging level
+        **fields: Extra values to include
+    """
+    parts = [f"event={event}", f"request_id={request_id_var.get()}"]
+    for key, value in fields.items():
+        if isinstance(value, float):
+            value = f"{value:.3f}"
+        value = str(value)
+        if not value or any(c.isspace() or c in '"=' for c in value):
+            value = '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        parts.append(f"{key}={value}")
+    log.log(level, ' '.join(parts))
+
 def validate_youtube_url(url: str) -> bool:
     """
     Validate if the provided URL is a valid YouTube URL
     
     Args:
         url (str): YouTube URL to validate
-        
+    
     Returns:
         bool: True if valid YouTube URL, False otherwise
     """
@@ -28,6 +66,97 @@ def validate_youtube_url(url: str) -> bool:
         logger.warning(f"URL validation error: {e}")
         return False
 
+def parse_stream_url_expiry(stream_url: str) -> Optional[float]:
+    """
+    Extract the expiry timestamp from a resolved YouTube stream URL
+    
+    googlevideo URLs carry it as an ``expire=`` query parameter, HLS
+    manifest URLs as an ``/expire/<timestamp>/`` path segment.
+    
+    Args:
+        stream_url (str): Resolved stream URL
+    
+    Returns:
+        Optional[float]: Unix timestamp of expiry, or None if not present
+    """
+    from urllib.parse import urlparse, parse_qs
+    
+    try:
+        parsed = urlparse(stream_url)
+        expire = parse_qs(parsed.query).get('expire')
+        if expire:
+            return float(expire[0])
+        
+        match = re.search(r'/expire/(\d+)', parsed.path)
+        if match:
+            return float(match.group(1))
+    except ValueError as e:
+        logger.warning(f"Could not parse stream URL expiry: {e}")
+    
+    return None
+
+def is_stream_url_rejected(ffmpeg_error: str) -> bool:
+    """
+    Check whether an ffmpeg error means the stream URL expired or was revoked
+    
+    Args:
+        ffmpeg_error (str): ffmpeg stderr output or error message
+    
+    Returns:
+        bool: True if the server answered 403 or 404
+    """
+    return '403 Forbidden' in ffmpeg_error or '404 Not Found' in ffmpeg_error
+
+def parse_interval(text: str) -> Optional[int]:
+    """
+    Parse an interval such as "30s", "15m" or "1h"; bare numbers are minutes
+    
+    Args:
+        text (str): Interval as typed by the user
+    
+    Returns:
+        Optional[int]: Interval in seconds, or None if it can't be parsed
+    """
+    match = re.fullmatch(r'(\d+)\s*([smh]?)', text.strip().lower())
+    if not match:
+        return None
+    unit = {'s': 1, 'm': 60, '': 60, 'h': 3600}[match.group(2)]
+    return int(match.group(1)) * unit
+
+def parse_time_of_day(text: str, now: Optional[datetime] = None) -> Optional[float]:
+    """
+    Parse "HH:MM" as the most recent time it was that time of day (server time)
+    
+    Args:
+        text (str): Time as typed by the user, e.g. "14:30"
+        now (Optional[datetime]): Current local time, for testing
+    
+    Returns:
+        Optional[float]: Unix timestamp, or None if it can't be parsed
+    """
+    try:
+        parsed = datetime.strptime(text.strip(), '%H:%M')
+    except ValueError:
+        return None
+    now = now or datetime.now()
+    at = now.replace(hour=parsed.hour, minute=parsed.minute, second=0, microsecond=0)
+    if at > now:
+        at -= timedelta(days=1)  # Later today hasn't happened yet, so it means yesterday
+    return at.timestamp()
+
+def is_hls_url(stream_url: str) -> bool:
+    """
+    Check whether a resolved stream URL points to an HLS playlist
+    
+    Args:
+        stream_url (str): Resolved stream URL
+    
+    Returns:
+        bool: True for .m3u8 playlists and YouTube hls_playlist manifests
+    """
+    path = stream_url.split('?', 1)[0]
+    return path.endswith('.m3u8') or '/hls_playlist/' in path or '/hls_variant/' in path
+
 def cleanup_temp_directory(temp_dir: str, max_age_hours: int = 24) -> None:
     """
     Clean up old temporary files in the temp directory
@@ -61,7 +190,7 @@ def format_file_size(size_bytes: int) -> str:
     
     Args:
         size_bytes (int): Size in bytes
-        
+    
     Returns:
         str: Formatted size string
     """
@@ -74,6 +203,24 @@ def format_file_size(size_bytes: int) -> str:
     else:
         return f"{size_bytes / (1024 ** 3):.1f} GB"
 
+def format_age(seconds: float) -> str:
+    """
+    Format an age in seconds as a short human readable string
+    
+    Args:
+        seconds (float): Age in seconds
+    
+    Returns:
+        str: e.g. "45s", "12m" or "3h 5m"
+    """
+    seconds = int(max(0, seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    elif seconds < 3600:
+        return f"{seconds // 60}m"
+    else:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+
 def is_ffmpeg_available() -> bool:
     """
     Check if ffmpeg is available in the system PATH
@@ -0,0 +1,90 @@
+"""
+Picks the stream variant that yields a capture profile's frame the fastest
+"""
+
+import time
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+from config import Config
+from stream_resolver import StreamVariant
+from metrics import VARIANT_FIRST_FRAME_SECONDS, VARIANT_FAILURES
+
+logger = logging.getLogger(__name__)
+
+class VariantSelector:
+    """
+    Chooses which variant of a stream to capture from
+    
+    Starts with the lowest-bitrate variant that is tall enough for the
+    profile, since ffmpeg has the least to download before its first frame.
+    Measured capture latency per stream and variant then steers later
+    choices, and variants that just failed are skipped for a while.
+    """
+    
+    def __init__(self, config: Config):
+        self.config = config
+        # Keyed by (youtube_url, format_id)
+        self.latency: Dict[Tuple[str, str], float] = {}
+        self.failed_at: Dict[Tuple[str, str], float] = {}
+    
+    def candidates(self, variants: List[StreamVariant], min_height: Optional[int]) -> List[StreamVariant]:
+        """Variants tall enough for min_height, lowest bitrate first"""
+        tall = [v for v in variants if not min_height or v.height is None or v.height >= min_height]
+        if not tall:
+            # Nothing is tall enough, the tallest variant is the closest match
+            tall = [max(variants, key=lambda v: (v.height or 0, v.tbr or 0))]
+        return sorted(tall, key=lambda v: (v.tbr is None, v.tbr or 0, v.height or 0))
+    
+    def choose(
+        self,
+        youtube_url: str,
+        variants: List[StreamVariant],
+        min_height: Optional[int],
+        exclude: Sequence[str] = ()
+    ) -> Optional[StreamVariant]:
+        """
+        Pick the variant to capture from
+        
+        Args:
+            youtube_url (str): Stream the variants belong to
+            variants (List[StreamVariant]): Variants from the resolver
+            min_height (Optional[int]): Height the capture profile needs
+            exclude (Sequence[str]): format_ids already tried for this capture
+        
+        Returns:
+            Optional[StreamVariant]: Chosen variant, or None if all were excluded
+        """
+        candidates = [v for v in self.candidates(variants, min_height) if v.format_id not in exclude]
+        if not candidates:
+            return None
+        
+        now = time.time()
+        healthy = [
+            v for v in candidates
+            if now - self.failed_at.get((youtube_url, v.format_id), 0) > self.config.VARIANT_FAILURE_COOLDOWN
+        ] or candidates
+        
+        # The cheapest variant is tried until it has a measurement, then the
+        # fastest measured variant wins
+        first = healthy[0]
+        if (youtube_url, first.format_id) not in self.latency:
+            return first
+        measured = [v for v in healthy if (youtube_url, v.format_id) in self.latency]
+        return min(measured, key=lambda v: self.latency[(youtube_url, v.format_id)])
+    
+    def get_latency(self, youtube_url: str, variant: StreamVariant) -> Optional[float]:
+        return self.latency.get((youtube_url, variant.format_id))
+    
+    def record_success(self, youtube_url: str, variant: StreamVariant, seconds: float):
+        """Fold a capture's time to first frame into the variant's moving average"""
+        key = (youtube_url, variant.format_id)
+        previous = self.latency.get(key)
+        alpha = self.config.VARIANT_LATENCY_ALPHA
+        latency = seconds if previous is None else alpha * seconds + (1 - alpha) * previous
+        self.latency[key] = latency
+        self.failed_at.pop(key, None)
+        VARIANT_FIRST_FRAME_SECONDS.set(latency, youtube_url=youtube_url, variant=variant.label)
+    
+    def record_failure(self, youtube_url: str, variant: StreamVariant):
+        self.failed_at[(youtube_url, variant.format_id)] = time.time()
+        VARIANT_FAILURES.inc(youtube_url=youtube_url, variant=variant.label)
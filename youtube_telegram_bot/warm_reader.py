@@ -0,0 +1,156 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+from config import Config
+from process_governor import ProcessGovernor
+from utils import is_stream_url_rejected
+
+logger = logging.getLogger(__name__)
+
+JPEG_START = b'\xff\xd8'
+JPEG_END = b'\xff\xd9'
+
+class WarmStreamReader:
+    """Keeps one ffmpeg process decoding a live stream and holds its most recent frames"""
+    
+    def __init__(
+        self,
+        config: Config,
+        youtube_url: str,
+        get_stream_url: Callable[[str], Awaitable[Optional[str]]],
+        invalidate_stream_url: Callable[[str, str], Awaitable[None]],
+        governor: ProcessGovernor
+    ):
+        self.config = config
+        self.youtube_url = youtube_url
+        self.get_stream_url = get_stream_url
+        self.invalidate_stream_url = invalidate_stream_url
+        self.governor = governor
+        
+        # Ring buffer of (captured_at, jpeg bytes), newest last
+        self.frames: Deque[Tuple[float, bytes]] = deque(maxlen=config.WARM_READER_BUFFER_FRAMES)
+        self.last_request = time.time()
+        self.task: Optional[asyncio.Task] = None
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.failures = 0
+    
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+    
+    def start(self):
+        """Start the supervisor task if it isn't running"""
+        self.last_request = time.time()
+        if not self.running:
+            logger.info(f"Starting warm reader for {self.youtube_url}")
+            self.task = asyncio.create_task(self.supervise())
+    
+    def latest_frame(self) -> Optional[Tuple[float, bytes]]:
+        """Return the newest decoded frame and keep the reader alive"""
+        self.start()
+        return self.frames[-1] if self.frames else None
+    
+    def is_idle(self) -> bool:
+        return time.time() - self.last_request > self.config.WARM_READER_IDLE_TIMEOUT
+    
+    async def supervise(self):
+        """Run ffmpeg, restarting it with back-off until the reader goes idle"""
+        while not self.is_idle():
+            got_frames = await self.run_once()
+            if self.is_idle():
+                break
+            
+            if got_frames:
+                self.failures = 0
+            else:
+                self.failures += 1
+            
+            delay = min(
+                self.config.WARM_READER_MAX_BACKOFF,
+                self.config.WARM_READER_BACKOFF * (2 ** max(self.failures - 1, 0))
+            )
+            logger.warning(f"Warm reader for {self.youtube_url} stopped, restarting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+        
+        logger.info(f"Warm reader for {self.youtube_url} idle, shutting down")
+        self.frames.clear()
+    
+    async def run_once(self) -> bool:
+        """Decode the stream until ffmpeg exits, stalls or the reader goes idle"""
+        stream_url = await self.get_stream_url(self.youtube_url)
+        if not stream_url:
+            return False
+        
+        # Decoded with the default profile's filters, always as JPEG for the frame parser
+        profile = self.config.CAPTURE_PROFILES[self.config.DEFAULT_CAPTURE_PROFILE]
+        cmd = [
+            'ffmpeg',
+            '-loglevel', 'error',
+            '-threads', str(self.governor.threads),
+            '-i', stream_url,
+            '-vf', f"fps={self.config.WARM_READER_FPS},{profile['vf']}",
+            '-q:v', str(profile.get('q:v', 2)),
+            '-c:v', 'mjpeg',
+            '-f', 'image2pipe',
+            'pipe:1'
+        ]
+        # Runs until the reader goes idle, so it gets no CPU time limit
+        async with self.governor.spawn(
+            'warm_reader', cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        ) as process:
+            self.process = process
+            stderr_task = asyncio.create_task(process.stderr.read())
+            got_frames = False
+            
+            try:
+                buffer = bytearray()
+                while not self.is_idle():
+                    chunk = await asyncio.wait_for(
+                        process.stdout.read(65536),
+                        timeout=self.config.FFMPEG_TIMEOUT
+                    )
+                    if not chunk:
+                        break
+                    
+                    buffer.extend(chunk)
+                    while True:
+                        end = buffer.find(JPEG_END)
+                        if end == -1:
+                            break
+                        start = buffer.find(JPEG_START)
+                        if 0 <= start < end:
+                            self.frames.append((time.time(), bytes(buffer[start:end + 2])))
+                            got_frames = True
+                        del buffer[:end + 2]
+            except asyncio.TimeoutError:
+                logger.warning(f"Warm reader for {self.youtube_url} stalled")
+            finally:
+                await self.stop_process()
+                stderr = (await stderr_task).decode(errors='replace')
+                if is_stream_url_rejected(stderr):
+                    await self.invalidate_stream_url(self.youtube_url, stream_url)
+                if stderr.strip():
+                    logger.warning(f"Warm reader ffmpeg: {stderr.strip()[-500:]}")
+        
+        return got_frames
+    
+    async def stop_process(self):
+        """Kill the ffmpeg process if it is still running"""
+        process, self.process = self.process, None
+        await self.governor.kill(process)
+    
+    async def stop(self):
+        """Stop the reader and its ffmpeg process"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.stop_process()
+        self.frames.clear()
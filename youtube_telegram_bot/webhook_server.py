@@ -0,0 +1,124 @@
+import asyncio
+import hmac
+import signal
+import logging
+from typing import List, Optional
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+from config import Config
+from metrics import WEBHOOK_QUEUE_DEPTH, WEBHOOK_UPDATES
+from utils import log_event
+
+logger = logging.getLogger(__name__)
+
+class WebhookServer:
+    """Receives Telegram updates over HTTP and feeds them to a bounded worker pool"""
+    
+    def __init__(self, config: Config, application: Application):
+        self.config = config
+        self.application = application
+        # Bounded so a burst can't pile up unbounded work; when full we answer
+        # 429 and Telegram redelivers the update later
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=config.WEBHOOK_QUEUE_SIZE)
+        self.workers: List[asyncio.Task] = []
+        self.runner: Optional[web.AppRunner] = None
+    
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.config.WEBHOOK_PATH, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        return app
+    
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Queue an incoming update, or push back when the bot is overloaded"""
+        # Updates carry the sender's user id, so only Telegram may post them
+        secret = self.config.WEBHOOK_SECRET_TOKEN
+        if not secret or not hmac.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), secret):
+            WEBHOOK_UPDATES.inc(result='forbidden')
+            return web.Response(status=403)
+        
+        try:
+            data = await request.json()
+        except ValueError:
+            WEBHOOK_UPDATES.inc(result='invalid')
+            return web.Response(status=400)
+        
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            WEBHOOK_UPDATES.inc(result='rejected')
+            log_event(logger, 'webhook_overloaded', logging.WARNING, queue_size=self.queue.qsize())
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        
+        WEBHOOK_UPDATES.inc(result='accepted')
+        WEBHOOK_QUEUE_DEPTH.set(self.queue.qsize())
+        return web.Response()
+    
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({'queue': self.queue.qsize(), 'workers': len(self.workers)})
+    
+    async def worker(self):
+        """Process queued updates one at a time"""
+        while True:
+            data = await self.queue.get()
+            WEBHOOK_QUEUE_DEPTH.set(self.queue.qsize())
+            try:
+                update = Update.de_json(data, self.application.bot)
+                await self.application.process_update(update)
+            except Exception as e:
+                log_event(logger, 'webhook_update_failed', logging.ERROR, error=str(e))
+            finally:
+                self.queue.task_done()
+    
+    async def start(self):
+        """Start the HTTP server and workers and register the webhook with Telegram"""
+        self.workers = [
+            asyncio.create_task(self.worker()) for _ in range(self.config.WEBHOOK_WORKERS)
+        ]
+        
+        self.runner = web.AppRunner(self.create_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.config.WEBHOOK_LISTEN, self.config.WEBHOOK_PORT)
+        await site.start()
+        logger.info(f"Webhook server listening on {self.config.WEBHOOK_LISTEN}:{self.config.WEBHOOK_PORT}")
+        
+        if self.config.WEBHOOK_URL:
+            await self.application.bot.set_webhook(
+                url=self.config.WEBHOOK_URL,
+                secret_token=self.config.WEBHOOK_SECRET_TOKEN,
+                max_connections=self.config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info(f"Webhook registered at {self.config.WEBHOOK_URL}")
+    
+    async def stop(self):
+        """Stop accepting updates and cancel the workers"""
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+    
+    async def serve(self):
+        """Run the bot in webhook mode until SIGINT/SIGTERM"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass  # Windows, Ctrl+C still raises KeyboardInterrupt
+        
+        async with self.application:
+            if self.application.post_init:
+                await self.application.post_init(self.application)
+            try:
+                await self.start()
+                await stop_event.wait()
+            finally:
+                await self.stop()
+                if self.application.post_shutdown:
+                    await self.application.post_shutdown(self.application)